@@ -17,8 +17,22 @@
 # along with AAWS.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from proxy import ServiceProxy, ManagerProxy
+from proxy import ServiceProxy, ManagerProxy, TransportProxy
 from request import AWSRequestManager, AWSRequest
+from future import Future
+from connection import ConnectionPool
+from resolver import Resolver
+from eventloop import EPollBackend
+from ratelimit import RateLimiter
+from concurrency import AIMD
+from hedge import Hedger
+from cache import ResponseCache
+from timing import Timing
+from metrics import MetricsRegistry, Histogram
+from slowlog import SlowLog
+from profiling import Profiler
+from replay import Recorder, Replayer
+from aio import AsyncioTransport
 from aws import AWSService, AWSError, getBotoCredentials
 from sqs import SQS
 from sns import SNS
@@ -0,0 +1,304 @@
+#
+# Copyright 2011 Snitch Incorporated
+#
+# This file is part of AAWS.
+#
+# AAWS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# AAWS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with AAWS.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#               aio.py,
+#
+#                       This module runs AWSRequests on an asyncio event loop instead of asyncore, so that
+#                       AWS calls can share a loop with other asyncio based code. It needs trollius (asyncio
+#                       for Python 2). Requests are built, signed and their responses handled exactly as
+#                       with AWSRequestManager; only the transport differs, and requests for endpoints that
+#                       need HTTPS (such as route53) are sent over TLS. For example:
+#
+#                               transport = AsyncioTransport()
+#                               transport.addService('sqs', SQS('us-west-1', key, secret))
+#                               msgs = yield From(transport.sqs.ReceiveMessage(queue))
+#                               results = yield From(asyncio.gather(*[transport.execute(req) for req in reqs]))
+#
+#
+
+try:
+    import trollius as asyncio
+    from trollius import From, Return, coroutine
+except ImportError:
+    asyncio = None
+    def coroutine(func):
+        return func
+import random
+import time
+import socket
+import aws
+import proxy
+import ratelimit
+
+
+class _Watchdog(object):
+    # Cancels task if progress() isn't called for timeout seconds; one timer per request is much
+    # cheaper than wrapping every read in wait_for.
+
+    def __init__(self, loop, task, timeout):
+        self._loop = loop
+        self._task = task
+        self._timeout = timeout
+        self._last = loop.time()
+        self.fired = False
+        self._handle = loop.call_later(timeout, self._check)
+
+    def progress(self):
+        self._last = self._loop.time()
+
+    def _check(self):
+        idle = self._loop.time() - self._last
+        if idle >= self._timeout:
+            self.fired = True
+            self._task.cancel()
+        else:
+            self._handle = self._loop.call_later(self._timeout - idle, self._check)
+
+    def cancel(self):
+        self._handle.cancel()
+
+
+class AsyncioTransport(object):
+    """Executes AWSRequests as coroutines on an asyncio loop, over pooled keep-alive connections.
+            The limits, timeouts and retry backoff have the same meaning as for AWSRequestManager.
+
+            idleTimeout -- seconds an idle connection is kept for reuse.
+            maxIdle -- maximum number of idle connections kept per host.
+            maxRequests -- number of requests after which a connection is retired rather than reused.
+            limiter -- the ratelimit.RateLimiter that paces requests, as for AWSRequestManager.
+            """
+
+    def __init__(self, loop=None, maxInFlight=128, maxPerHost=32, connectTimeout=10.0, readTimeout=60.0,
+                    backoff=0.1, maxBackoff=20.0, idleTimeout=15.0, maxIdle=32, maxRequests=100, limiter=None):
+        if asyncio is None:
+            raise ImportError('AsyncioTransport requires trollius')
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self._loop = loop
+        self.maxPerHost = maxPerHost
+        self.connectTimeout = connectTimeout
+        self.readTimeout = readTimeout
+        self.backoff = backoff
+        self.maxBackoff = maxBackoff
+        self.idleTimeout = idleTimeout
+        self.maxIdle = maxIdle
+        self.maxRequests = maxRequests
+        self._slots = None
+        if maxInFlight is not None:
+            self._slots = asyncio.Semaphore(maxInFlight, loop=loop)
+        self._hostSlots = {}
+        self._idle = {}                 # host -> [(reader, writer, released, uses)]
+        if limiter is None:
+            limiter = ratelimit.RateLimiter()
+        self.limiter = limiter
+
+    def addService(self, name, service):
+        setattr(self, name, proxy.TransportProxy(self, service))
+
+    def execute(self, request, retries=5, follow=10):
+        """Return a coroutine that runs request to completion, retrying and following it like
+                AWSRequestManager.execute, and returns its result."""
+        return self._execute(request, retries, follow)
+
+    @coroutine
+    def _execute(self, request, retries, follow):
+        request._accum = None
+        attempt = 0
+        while True:
+            try:
+                request.result = yield From(self.send(request))
+            except asyncio.CancelledError:
+                raise                   # trollius makes it an Exception, but it is no failure to retry
+            except Exception, e:
+                if retries <= 0 or not aws.isRetryable(e):
+                    raise
+                retries -= 1
+                yield From(asyncio.sleep(random.uniform(0, min(self.maxBackoff, self.backoff * 2 ** attempt)), loop=self._loop))
+                attempt += 1
+                continue
+            if not follow:
+                raise Return(request.result)
+            if not request.follow(request):
+                raise Return(request._accum)
+            follow -= 1
+            if follow < 0:
+                raise aws.AWSError(-1, 'follows exceeded', request)
+
+    @coroutine
+    def send(self, request):
+        """Make a single attempt at request, and return the result of its handler"""
+        delay = self.limiter.reserve(request)
+        if delay > 0:
+            yield From(asyncio.sleep(delay, loop=self._loop))
+        host = request._host
+        hostSlots = None
+        if self.maxPerHost is not None:
+            hostSlots = self._hostSlots.get(host)
+            if hostSlots is None:
+                hostSlots = self._hostSlots[host] = asyncio.Semaphore(self.maxPerHost, loop=self._loop)
+            yield From(hostSlots.acquire())
+        try:
+            if self._slots is not None:
+                yield From(self._slots.acquire())
+            try:
+                result = yield From(self._send(request))
+            finally:
+                if self._slots is not None:
+                    self._slots.release()
+        finally:
+            if hostSlots is not None:
+                hostSlots.release()
+        raise Return(result)
+
+    @coroutine
+    def _send(self, request):
+        host = request._host
+        timeout = request.readTimeout if request.readTimeout is not None else self.readTimeout
+        watchdog = None
+        task = asyncio.Task.current_task(loop=self._loop)
+        if timeout is not None and task is not None:
+            watchdog = _Watchdog(self._loop, task, timeout)
+        reader, writer, uses = self._acquire(host)
+        try:
+            while True:
+                if reader is None:
+                    host, port = request.getAddress()
+                    connect = asyncio.open_connection(host, port, ssl=request.secure, loop=self._loop)
+                    timeout = request.connectTimeout if request.connectTimeout is not None else self.connectTimeout
+                    if timeout is not None:
+                        connect = asyncio.wait_for(connect, timeout, loop=self._loop)
+                    reader, writer = yield From(connect)
+                    uses = 0
+                answered = False
+                try:
+                    writer.write(request.makeRequestHead())
+                    for data in request.iterBody():
+                        writer.write(data)
+                        yield From(writer.drain())
+                        if watchdog is not None:
+                            watchdog.progress()
+                    line = yield From(reader.readline())
+                    if not line:
+                        raise EOFError('connection closed')
+                    answered = True
+                    keepalive = yield From(self._readResponse(request, reader, line, watchdog))
+                    break
+                except (EOFError, socket.error), e:
+                    writer.close()
+                    if uses and not answered:
+                        # a pooled connection was closed by the server before it answered, try a fresh one
+                        reader = None
+                        continue
+                    raise
+                except:
+                    writer.close()
+                    raise
+        except asyncio.CancelledError:
+            if watchdog is not None and watchdog.fired:
+                raise asyncio.TimeoutError('read timed out')
+            raise
+        finally:
+            if watchdog is not None:
+                watchdog.cancel()
+        if keepalive:
+            self._release(host, reader, writer, uses + 1)
+        else:
+            writer.close()
+        raise Return(request.finishResponse())
+
+    @coroutine
+    def _readResponse(self, request, reader, line, watchdog):
+        # Read the response whose status line is line into request, through the same header parsing
+        # and body handling that AWSConnection uses. Returns True if the connection can be reused.
+        response = request.newResponse()
+        lines = [line]
+        while True:
+            line = yield From(reader.readline())
+            if not line:
+                raise EOFError('connection closed')
+            if line in ('\r\n', '\n'):
+                break
+            lines.append(line)
+        if watchdog is not None:
+            watchdog.progress()
+        response.parseHeaders(''.join(lines).rstrip('\r\n'))
+        length = response.getHeader('content-length')
+        if request._verb == 'HEAD' or response.status in (204, 304):
+            pass
+        elif 'chunked' in response.getHeader('transfer-encoding', '').lower():
+            while True:
+                line = yield From(reader.readline())
+                if not line:
+                    raise EOFError('connection closed')
+                size = int(line.split(';', 1)[0], 16)
+                if size == 0:
+                    break
+                yield From(self._readBody(request, reader, size, watchdog))
+                yield From(reader.readexactly(2))
+            while True:
+                line = yield From(reader.readline())
+                if line in ('\r\n', '\n', ''):
+                    break
+        elif length is not None:
+            yield From(self._readBody(request, reader, int(length), watchdog))
+        else:
+            response.keepalive = False
+            while True:
+                data = yield From(reader.read(request.maxRead))
+                if not data:
+                    break
+                if watchdog is not None:
+                    watchdog.progress()
+                request.handle_body(data)
+        raise Return(response.keepalive)
+
+    @coroutine
+    def _readBody(self, request, reader, remaining, watchdog):
+        while remaining:
+            data = yield From(reader.read(min(remaining, request.maxRead)))
+            if not data:
+                raise EOFError('connection closed')
+            if watchdog is not None:
+                watchdog.progress()
+            remaining -= len(data)
+            request.handle_body(data)
+
+    def _acquire(self, host):
+        idle = self._idle.get(host)
+        now = time.time()
+        while idle:
+            reader, writer, released, uses = idle.pop()
+            if now - released < self.idleTimeout and not reader.at_eof():
+                return reader, writer, uses
+            writer.close()
+        return None, None, 0
+
+    def _release(self, host, reader, writer, uses):
+        idle = self._idle.setdefault(host, [])
+        if uses >= self.maxRequests or len(idle) >= self.maxIdle:
+            writer.close()
+        else:
+            idle.append((reader, writer, time.time(), uses))
+
+    def close(self):
+        """Close every idle connection"""
+        for idle in self._idle.values():
+            for _, writer, _, _ in idle:
+                writer.close()
+        self._idle = {}
@@ -21,6 +21,7 @@
 import request
 from xml.etree import ElementTree as ET
 import os.path
+import re
 
 
 # Services to implement:
@@ -42,6 +43,21 @@ def getBotoCredentials():
     return key, secret
 
 
+# Error codes that mean "try again later" rather than "this request is wrong"
+RETRYABLE_CODES = frozenset([
+        'Throttling', 'ThrottlingException', 'RequestThrottled', 'RequestLimitExceeded', 'SlowDown',
+        'ServiceUnavailable', 'InternalError', 'InternalFailure', 'RequestTimeout', 'PriorRequestNotComplete',
+])
+
+# Error codes that mean the caller is going too fast
+THROTTLING_CODES = frozenset([
+        'Throttling', 'ThrottlingException', 'RequestThrottled', 'RequestLimitExceeded', 'SlowDown',
+        'ServiceUnavailable',
+])
+
+_codeRE = re.compile(r'<Code>([^<]*)</Code>')
+
+
 class AWSError(Exception):
 
     def __init__(self, status, reason, data):
@@ -50,6 +66,34 @@ class AWSError(Exception):
     def __str__(self):
         return '(%s %s)\n%s' % (self.status, self.reason, self.data)
 
+    @property
+    def code(self):
+        """The error Code from the AWS error response body (e.g. 'Throttling'), or None"""
+        if isinstance(self.data, basestring):
+            match = _codeRE.search(self.data)
+            if match is not None:
+                return match.group(1)
+        return None
+
+
+def isRetryable(error):
+    """Classify the result of a failed request. AWS errors are worth retrying if they are server
+            side (5xx) or throttling, client errors (other 4xx) will fail the same way again.
+            Anything else (connection failures, timeouts, bad responses) is assumed transient.
+            """
+    if isinstance(error, AWSError):
+        if error.code in RETRYABLE_CODES:
+            return True
+        return not (error.status < 0 or 400 <= error.status < 500)
+    return True
+
+
+def isThrottle(error):
+    """True if a failed request's error says AWS is throttling us (a throttling code, or 503)"""
+    if isinstance(error, AWSError):
+        return error.code in THROTTLING_CODES or error.status == 503
+    return False
+
 
 class AWSCompoundError(Exception):
 
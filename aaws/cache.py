@@ -0,0 +1,181 @@
+#
+# Copyright 2011 Snitch Incorporated
+#
+# This file is part of AAWS.
+#
+# AAWS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# AAWS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with AAWS.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#               cache.py,
+#
+#                       This module caches the results of requests whose answers rarely change, such as
+#                       CreateQueue (which just returns the URL of an existing queue) or GetTopicAttributes,
+#                       so that code which asks for them every time it runs doesn't pay a round trip for
+#                       each. Results are kept for a time set per Action, and are dropped early when a
+#                       request that changes them (SetQueueAttributes for GetQueueAttributes) completes.
+#                       To cache for every request made, including AWSRequest.execute() and GET():
+#
+#                               aaws.request.responseCache = aaws.ResponseCache()
+#
+#
+
+import collections
+import threading
+import time
+
+
+# Seconds to keep the results of these Actions for
+DEFAULT_TTLS = {
+    'CreateQueue': 3600,
+    'GetQueueUrl': 3600,
+    'GetQueueAttributes': 10,
+    'CreateTopic': 3600,
+    'GetTopicAttributes': 300,
+    'DomainMetadata': 60,
+    'DescribeInstances': 10,
+}
+
+# Actions that make the cached results of others stale
+DEFAULT_INVALIDATIONS = {
+    'SetQueueAttributes': ('GetQueueAttributes',),
+    'AddPermission': ('GetQueueAttributes',),
+    'RemovePermission': ('GetQueueAttributes',),
+    'DeleteQueue': ('CreateQueue', 'GetQueueUrl', 'GetQueueAttributes', 'ListQueues'),
+    'SetTopicAttributes': ('GetTopicAttributes',),
+    'Subscribe': ('GetTopicAttributes',),
+    'Unsubscribe': ('GetTopicAttributes',),
+    'DeleteTopic': ('CreateTopic', 'GetTopicAttributes', 'ListTopics'),
+    'PutAttributes': ('DomainMetadata',),
+    'BatchPutAttributes': ('DomainMetadata',),
+    'DeleteAttributes': ('DomainMetadata',),
+    'DeleteDomain': ('DomainMetadata', 'ListDomains'),
+    'RunInstances': ('DescribeInstances',),
+    'StartInstances': ('DescribeInstances',),
+    'StopInstances': ('DescribeInstances',),
+    'RebootInstances': ('DescribeInstances',),
+    'TerminateInstances': ('DescribeInstances',),
+    'CreateTags': ('DescribeInstances',),
+    'DeleteTags': ('DescribeInstances',),
+}
+
+
+class ResponseCache(object):
+    """Least recently used cache of request results, for AWSRequestManager(cache=...) or
+            request.responseCache.
+
+            ttls -- {Action: seconds} for the Actions to cache (by default DEFAULT_TTLS). Requests
+                    for any other Action pass straight through.
+            maxEntries, maxBytes -- bounds on the number of results kept and the total size of the
+                    responses they came from; the least recently used go first.
+            invalidations -- {Action: [Actions]}: a request for the first drops the cached results of
+                    the others (by default DEFAULT_INVALIDATIONS). Only results for the same endpoint,
+                    access key and resource are dropped: those for the same path (or either is '/'),
+                    that agree on every single valued parameter both requests have, e.g. TopicArn.
+                    List parameters such as InstanceId.1 aren't compared.
+
+            A request is only answered from the cache if it is identical to the one cached (see
+            AWSRequest.identity), and the same result object is returned each time, so it must not be
+            modified. None results aren't cached. hits and misses count lookups for cached Actions.
+
+            Any object with the lookup, store and invalidate methods below may be used instead.
+            """
+
+    def __init__(self, ttls=None, maxEntries=1024, maxBytes=8 << 20, invalidations=None):
+        if ttls is None:
+            ttls = DEFAULT_TTLS
+        if invalidations is None:
+            invalidations = DEFAULT_INVALIDATIONS
+        self.ttls = dict(ttls)
+        self.invalidations = dict(invalidations)
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()       # identity -> (expires, size, result), oldest use first
+        self._scopes = {}               # (host, key, action) -> set of identities cached for it
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, request):
+        """Return the cached result for request, or None"""
+        ttl = self.ttls.get(request._action)
+        if ttl is None:
+            return None
+        identity = request.identity()
+        with self._lock:
+            entry = self._entries.pop(identity, None)
+            if entry is not None:
+                if entry[0] > time.time():
+                    self._entries[identity] = entry     # now the most recently used
+                    self.hits += 1
+                    return entry[2]
+                self._forget(identity, entry)
+            self.misses += 1
+        return None
+
+    def store(self, request, result, size):
+        """Cache result, the response of size bytes to request, if its Action is cached"""
+        ttl = self.ttls.get(request._action)
+        if ttl is None or result is None or size > self.maxBytes:
+            return
+        identity = request.identity()
+        with self._lock:
+            entry = self._entries.pop(identity, None)
+            if entry is not None:
+                self._forget(identity, entry)
+            self._entries[identity] = (time.time() + ttl, size, result)
+            self.bytes += size
+            scope = (request._host, request._key, request._action)
+            identities = self._scopes.get(scope)
+            if identities is None:
+                identities = self._scopes[scope] = set()
+            identities.add(identity)
+            while len(self._entries) > self.maxEntries or self.bytes > self.maxBytes:
+                self._forget(*self._entries.popitem(last=False))
+
+    def invalidate(self, request):
+        """Drop the cached results that request (which has been sent) may have made stale"""
+        actions = self.invalidations.get(request._action)
+        if actions is None:
+            return
+        uri = request._uri
+        parameters = request._parameters
+        with self._lock:
+            for action in actions:
+                for identity in list(self._scopes.get((request._host, request._key, action), ())):
+                    if identity[2] != uri and '/' not in (identity[2], uri):
+                        continue
+                    for name, value in identity[5]:
+                        if '.' not in name and parameters.get(name, value) != value:
+                            break
+                    else:
+                        self._forget(identity, self._entries.pop(identity))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._scopes = {}
+            self.bytes = 0
+
+    def _forget(self, identity, entry):
+        # identity's entry has been removed from _entries: remove it from the byte count and scopes
+        self.bytes -= entry[1]
+        scope = (identity[0], identity[3], identity[4])
+        identities = self._scopes[scope]
+        identities.discard(identity)
+        if not identities:
+            del self._scopes[scope]
@@ -0,0 +1,107 @@
+#
+# Copyright 2011 Snitch Incorporated
+#
+# This file is part of AAWS.
+#
+# AAWS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# AAWS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with AAWS.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#               concurrency.py,
+#
+#                       This module adjusts how many requests AWSRequestManager keeps in flight to each
+#                       endpoint, the way TCP adjusts its congestion window: the limit grows by about one
+#                       for each round of successful requests, and is cut by a factor as soon as AWS
+#                       throttles us or latency climbs well above its long run average.
+#
+#
+
+import time
+
+
+class _HostLimit(object):
+    __slots__ = ('limit', 'srtt', 'baseline', 'samples', 'lastCut')
+
+    def __init__(self, limit):
+        self.limit = float(limit)
+        self.srtt = None                # latency smoothed over the last ten or so requests
+        self.baseline = None            # latency averaged over the last few hundred
+        self.samples = 0
+        self.lastCut = 0
+
+
+class AIMD(object):
+    """Additive increase, multiplicative decrease concurrency limits, one per endpoint host.
+
+            initial -- limit a host starts with.
+            minimum, maximum -- bounds on the limit.
+            backoff -- factor the limit is cut by when a request is throttled (or times out).
+            latencyBackoff -- factor it is cut by when latency smoothed over the last few requests
+                    exceeds tolerance times its long run average. Latency that jitters around a steady
+                    average doesn't do that; latency that is climbing does.
+            """
+
+    def __init__(self, initial=4, minimum=1, maximum=128, backoff=0.5, latencyBackoff=0.9, tolerance=2.0):
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.latencyBackoff = latencyBackoff
+        self.tolerance = tolerance
+        self._hosts = {}
+
+    def limit(self, host):
+        """The number of requests that may be in flight to host"""
+        state = self._hosts.get(host)
+        if state is None:
+            return self.initial
+        return int(state.limit)
+
+    def limits(self):
+        """The current limit of every host seen so far"""
+        return dict([(host, int(state.limit)) for host, state in self._hosts.items()])
+
+    def success(self, host, latency, inflight):
+        """Record a request to host that succeeded after latency seconds, with inflight requests
+                (itself included) in flight at the time"""
+        state = self._state(host)
+        state.samples += 1
+        if state.srtt is None:
+            state.srtt = state.baseline = latency
+        else:
+            # plain averages until there are enough samples for the moving ones to settle
+            state.srtt += max(0.1, 1.0 / state.samples) * (latency - state.srtt)
+            state.baseline += max(0.005, 1.0 / state.samples) * (latency - state.baseline)
+        if state.srtt > self.tolerance * state.baseline:
+            self._cut(state, self.latencyBackoff)
+        elif inflight * 2 >= state.limit:
+            # only grow while the limit is actually being used, or it grows without bound when idle
+            state.limit = min(self.maximum, state.limit + 1.0 / state.limit)
+
+    def throttled(self, host):
+        """Record a request to host that was throttled or timed out"""
+        self._cut(self._state(host), self.backoff)
+
+    def _state(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _HostLimit(self.initial)
+        return state
+
+    def _cut(self, state, factor):
+        # a burst of throttling is one signal: cut at most once per round trip
+        now = time.time()
+        if state.srtt is not None and now - state.lastCut < state.srtt:
+            return
+        state.lastCut = now
+        state.limit = max(self.minimum, state.limit * factor)
@@ -0,0 +1,101 @@
+#
+# Copyright 2011 Snitch Incorporated
+#
+# This file is part of AAWS.
+#
+# AAWS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# AAWS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with AAWS.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#               connection.py,
+#
+#                       This module keeps HTTP/1.1 keep-alive sockets around between requests so that a
+#                       stream of requests to the same AWS endpoint only pays for one TCP handshake.
+#                       Sockets are parked here by AWSRequest once a response has been completely read,
+#                       and handed back out to the next request for the same host.
+#
+#
+
+import time
+import socket
+import errno
+
+
+class ConnectionPool(object):
+    """A per-host pool of idle, already connected sockets.
+
+            idleTimeout -- seconds a socket may sit idle in the pool before it is discarded.
+            maxIdle -- maximum number of idle sockets kept per host, extra sockets are closed.
+            maxRequests -- number of requests after which a socket is retired rather than reused.
+            """
+
+    def __init__(self, idleTimeout=15.0, maxIdle=32, maxRequests=100):
+        self.idleTimeout = idleTimeout
+        self.maxIdle = maxIdle
+        self.maxRequests = maxRequests
+        self._idle = {}
+
+    def acquire(self, host):
+        """Return (socket, uses) for an idle connection to host, or (None, 0) if there isn't one."""
+        idle = self._idle.get(host)
+        now = time.time()
+        while idle:
+            sock, released, uses = idle.pop()
+            if now - released < self.idleTimeout and self._alive(sock):
+                return sock, uses
+            self._close(sock)
+        return None, 0
+
+    def release(self, host, sock, uses):
+        """Park a connected socket that has just completed its uses'th request."""
+        idle = self._idle.setdefault(host, [])
+        if uses >= self.maxRequests or len(idle) >= self.maxIdle:
+            self._close(sock)
+        else:
+            idle.append((sock, time.time(), uses))
+
+    def prune(self):
+        """Close every socket that has been idle for longer than idleTimeout."""
+        now = time.time()
+        for host, idle in self._idle.items():
+            keep = []
+            for entry in idle:
+                if now - entry[1] < self.idleTimeout:
+                    keep.append(entry)
+                else:
+                    self._close(entry[0])
+            self._idle[host] = keep
+
+    def close(self):
+        for idle in self._idle.values():
+            for sock, _, _ in idle:
+                self._close(sock)
+        self._idle = {}
+
+    def __len__(self):
+        return sum([len(idle) for idle in self._idle.values()])
+
+    def _alive(self, sock):
+        # An idle keep-alive socket should have nothing to read; EOF or stray data means the server
+        # has given up on it.
+        try:
+            sock.recv(1, socket.MSG_PEEK)
+        except socket.error, e:
+            return e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK)
+        return False
+
+    def _close(self, sock):
+        try:
+            sock.close()
+        except socket.error:
+            pass
@@ -48,7 +48,7 @@ class EC2(AWSService):
         self._secret = secret
 
 
-    def DescribeInstances(self, InstanceIds=None, Filters=None):
+    def DescribeInstances(self, InstanceIds=None, Filters=None, Stream=False):
         """Returns information about instances that you own. If you specify one or more instance IDs, Amazon EC2 returns information
                 for those instances. If you do not specify instance IDs, Amazon EC2 returns information for all relevant instances. If
                 you specify an invalid instance ID, an error is returned. If you specify an instance that you do not own, it will not be
@@ -64,6 +64,8 @@ class EC2(AWSService):
                 You can use wildcards with the filter values: * matches zero or more characters, and ? matches exactly one character. You
                 can escape special characters using a backslash before the character. For example, a value of \\*amazon\\?\\\\ searches for
                 the literal string *amazon?\\.
+
+                Stream -- If True, parse the response as it is received rather than once it is complete.
                 """
 
         def findadd(m, node, attr):
@@ -74,28 +76,35 @@ class EC2(AWSService):
             if node is not None:
                 m[attr] = node.text
 
+        def instancesSet(instances, node):
+            for item in node.findall('{%s}item' % self.xmlns):
+                i = {}
+                for attr in ('instanceId', 'imageId', 'privateDnsName', 'dnsName', 'keyName', 'amiLaunchIndex', 'instanceType', 'launchTime',
+                                'kernelId', 'privateIpAddress', 'ipAddress', 'architecture', 'rootDeviceType', 'rootDeviceName', 'virtualizationType',
+                                'instanceState.code', 'instanceState.name', 'placement.availabilityZone', 'placement.tenancy', 'monitoring.state', 'hypervisor'):
+                    findadd(i, item, attr)
+                # XXX: groupSet, blockDeviceMapping
+                tags = {}
+                tagSet = item.find('{%s}tagSet' % self.xmlns)
+                for tagitem in tagSet.findall('{%s}item' % self.xmlns):
+                    tags[tagitem.find('{%s}key' % self.xmlns).text] = tagitem.find('{%s}value' % self.xmlns).text
+                i['tags'] = tags
+                instances.append(i)
+
         def response(status, reason, data):
             if status == 200:
 #                               print data
                 root = ET.fromstring(data)
                 instances = []
                 for node in root.findall('.//{%s}instancesSet' % self.xmlns):
-                    for item in node.findall('{%s}item' % self.xmlns):
-                        i = {}
-                        for attr in ('instanceId', 'imageId', 'privateDnsName', 'dnsName', 'keyName', 'amiLaunchIndex', 'instanceType', 'launchTime',
-                                        'kernelId', 'privateIpAddress', 'ipAddress', 'architecture', 'rootDeviceType', 'rootDeviceName', 'virtualizationType',
-                                        'instanceState.code', 'instanceState.name', 'placement.availabilityZone', 'placement.tenancy', 'monitoring.state', 'hypervisor'):
-                            findadd(i, item, attr)
-                        # XXX: groupSet, blockDeviceMapping
-                        tags = {}
-                        tagSet = item.find('{%s}tagSet' % self.xmlns)
-                        for tagitem in tagSet.findall('{%s}item' % self.xmlns):
-                            tags[tagitem.find('{%s}key' % self.xmlns).text] = tagitem.find('{%s}value' % self.xmlns).text
-                        i['tags'] = tags
-                        instances.append(i)
+                    instancesSet(instances, node)
                 return instances
             raise AWSError(status, reason, data)
 
+        def stream():
+            instances = []
+            return request.XMLStream({'{%s}instancesSet' % self.xmlns: lambda node: instancesSet(instances, node)}, lambda: instances)
+
         r = request.AWSRequest(self._endpoint, '/', self._key, self._secret, 'DescribeInstances', {
                         'Version': self.version,
                 }, response)
@@ -103,6 +112,8 @@ class EC2(AWSService):
             for idx, iid in enumerate(InstanceIds):
                 r.addParm('InstanceId.%d' % idx, iid)
         # XXX: Filters
+        if Stream:
+            r.stream = stream
         return r
 
 
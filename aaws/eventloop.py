@@ -0,0 +1,157 @@
+#
+# Copyright 2011 Snitch Incorporated
+#
+# This file is part of AAWS.
+#
+# AAWS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# AAWS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with AAWS.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#               eventloop.py,
+#
+#                       This module provides the backends AWSRequestManager can use to wait on its sockets.
+#                       A backend is any callable taking (timeout, map) that waits up to timeout seconds
+#                       for activity on the dispatchers in the asyncore map, and services them, just like
+#                       asyncore.poll. select() is limited to 1024 file descriptors and rescans every one
+#                       of them in the kernel each time around, so on Linux we use epoll instead.
+#                       It also provides the Waker other threads use to get the loop's attention.
+#
+#
+
+import asyncore
+import select
+import errno
+import socket
+import os
+import fcntl
+
+
+def selectBackend(timeout, _map):
+    asyncore.poll(timeout, _map)
+
+
+def pollBackend(timeout, _map):
+    asyncore.poll2(timeout, _map)
+
+
+class EPollBackend(object):
+    """Waits with a persistent epoll object. Registrations are carried from one call to the next,
+            so each call only makes syscalls for sockets that are new, gone or whose interest changed.
+            """
+
+    def __init__(self):
+        self._epoll = select.epoll()
+        self._registered = {}           # fd -> (socket, eventmask)
+
+    def __call__(self, timeout, _map):
+        registered = self._registered
+        for fd in registered.keys():
+            if fd not in _map:
+                self._unregister(fd)
+        for fd, obj in _map.items():
+            flags = 0
+            if obj.readable():
+                flags |= select.EPOLLIN | select.EPOLLPRI
+            if obj.writable() and not obj.accepting:
+                flags |= select.EPOLLOUT
+            current = registered.get(fd)
+            if current is not None:
+                if current[0] is obj.socket:
+                    if current[1] != flags:
+                        self._epoll.modify(fd, flags)
+                        registered[fd] = (obj.socket, flags)
+                    continue
+                # the fd was closed and reused for another socket, so the kernel has forgotten it
+                self._unregister(fd)
+            self._epoll.register(fd, flags)
+            registered[fd] = (obj.socket, flags)
+        if timeout is None:
+            timeout = -1
+        try:
+            events = self._epoll.poll(timeout)
+        except IOError, e:
+            if e.errno != errno.EINTR:
+                raise
+            events = []
+        for fd, flags in events:
+            obj = _map.get(fd)
+            if obj is not None:
+                asyncore.readwrite(obj, flags)
+
+    def _unregister(self, fd):
+        del self._registered[fd]
+        try:
+            self._epoll.unregister(fd)
+        except (IOError, ValueError):
+            pass                # already closed
+
+    def close(self):
+        self._epoll.close()
+        self._registered = {}
+
+
+class Waker(asyncore.file_dispatcher):
+    """The read end of a pipe that can sit in an asyncore map, so that another thread can wake
+            the loop with wake(). callback is then called on the loop's thread."""
+
+    def __init__(self, callback):
+        self._callback = callback
+        r, self._w = os.pipe()
+        fcntl.fcntl(self._w, fcntl.F_SETFL, fcntl.fcntl(self._w, fcntl.F_GETFL) | os.O_NONBLOCK)
+        asyncore.file_dispatcher.__init__(self, r, {})
+        self.del_channel()
+        self._r = r
+
+    def attach(self, _map):
+        if self._map is not _map or self._r not in _map:
+            self.del_channel()
+            self._map = _map
+            self._fileno = self._r              # del_channel forgets it
+            self.add_channel()
+
+    def detach(self):
+        self.del_channel()
+
+    def wake(self):
+        # safe to call from any thread
+        try:
+            os.write(self._w, 'x')
+        except OSError, e:
+            if e.errno != errno.EAGAIN:
+                raise
+
+    def close(self):
+        asyncore.file_dispatcher.close(self)    # leaves the map, and closes its copy of the read end
+        if self._r is not None:
+            os.close(self._r)
+            os.close(self._w)
+            self._r = self._w = None
+
+    def writable(self):
+        return False
+
+    def handle_read(self):
+        try:
+            self.recv(4096)
+        except (socket.error, OSError):
+            pass
+        self._callback()
+
+
+def default():
+    """The best backend available on this platform"""
+    if hasattr(select, 'epoll'):
+        return EPollBackend()
+    if hasattr(select, 'poll'):
+        return pollBackend
+    return selectBackend
@@ -0,0 +1,87 @@
+#
+# Copyright 2011 Snitch Incorporated
+#
+# This file is part of AAWS.
+#
+# AAWS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# AAWS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with AAWS.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#               future.py,
+#
+#                       This module holds the Future that AWSRequestManager.submit returns. It is set on
+#                       the manager's loop thread and can be waited on from any other thread, much like
+#                       concurrent.futures.Future, which Python 2 doesn't have.
+#
+#
+
+import threading
+import traceback
+import aws
+
+
+class Future(object):
+    """The eventual result of a submitted request: what execute() would have returned for it,
+            or the AWSCompoundError it would have raised."""
+
+    def __init__(self, request):
+        self.request = request
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._result = None
+        self._error = None
+        self._callbacks = []
+
+    def done(self):
+        return self._event.is_set()
+
+    def result(self, timeout=None):
+        """Wait up to timeout seconds (forever if None) for the request, then return its result
+                or raise its error"""
+        self._wait(timeout)
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+    def exception(self, timeout=None):
+        """Wait like result(), but return the error (None on success) instead of raising it"""
+        self._wait(timeout)
+        return self._error
+
+    def add_done_callback(self, callback):
+        """Call callback(future) once the request is done, on the manager's loop thread, or at
+                once if it is already done"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        self._call(callback)
+
+    def _wait(self, timeout):
+        if not self._event.wait(timeout):
+            raise aws.AWSError(-1, 'timed out waiting for result', self.request)
+
+    def _set(self, result, error):
+        with self._lock:
+            self._result = result
+            self._error = error
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            self._call(callback)
+
+    def _call(self, callback):
+        try:
+            callback(self)
+        except Exception:
+            traceback.print_exc()
@@ -0,0 +1,94 @@
+#
+# Copyright 2011 Snitch Incorporated
+#
+# This file is part of AAWS.
+#
+# AAWS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# AAWS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with AAWS.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#               hedge.py,
+#
+#                       This module decides when AWSRequestManager should hedge a read: send a second copy
+#                       of a request that is taking longer than most recent requests for the same action,
+#                       and use whichever copy answers first. This cuts the tail latency caused by the
+#                       occasional slow server, for a few percent of extra requests.
+#
+#
+
+import collections
+
+
+class Hedger(object):
+    """Hedging policy for AWSRequestManager(hedging=...).
+
+            percentile -- a request is hedged once it has run longer than this percentile of the
+                    recent latencies for its host and Action.
+            budget -- hedges sent are at most this fraction of the requests started.
+            window -- number of recent latencies kept per host and Action.
+            minSamples -- latencies needed before an action is hedged at all.
+            actions -- the Actions that may be hedged; by default any request that says it is
+                    idempotent (e.g. GetAttributes, DescribeInstances).
+
+            hedged and won count the hedges sent, and those that answered first.
+            """
+
+    def __init__(self, percentile=95, budget=0.05, window=200, minSamples=20, actions=None):
+        self.percentile = percentile
+        self.budget = budget
+        self.window = window
+        self.minSamples = minSamples
+        self.actions = actions
+        self.hedged = 0
+        self.won = 0
+        self._credit = 0.0
+        self._latencies = {}            # (host, action) -> deque of recent latencies
+        self._thresholds = {}           # (host, action) -> (latency to hedge at, records until recomputed)
+
+    def hedgeable(self, request):
+        """True if request may be sent twice"""
+        if self.actions is not None:
+            return request._verb == 'GET' and request._action in self.actions
+        return request.idempotent()
+
+    def delay(self, request):
+        """Seconds after it starts to hedge request, or None if too little is known yet. Every
+                request started counts towards the budget."""
+        self._credit = min(self._credit + self.budget, 10.0)
+        threshold = self._thresholds.get((request._host, request._action))
+        if threshold is None:
+            return None
+        return threshold[0]
+
+    def allow(self):
+        """Spend the budget for one hedge, if there is enough of it"""
+        if self._credit < 1:
+            return False
+        self._credit -= 1
+        self.hedged += 1
+        return True
+
+    def record(self, request, latency):
+        """Record how long a successful attempt at request took"""
+        key = (request._host, request._action)
+        latencies = self._latencies.get(key)
+        if latencies is None:
+            latencies = self._latencies[key] = collections.deque(maxlen=self.window)
+        latencies.append(latency)
+        threshold = self._thresholds.get(key)
+        if threshold is not None and threshold[1] > 1:
+            self._thresholds[key] = (threshold[0], threshold[1] - 1)
+        elif len(latencies) >= self.minSamples:
+            ordered = sorted(latencies)
+            at = ordered[min(len(ordered) - 1, len(ordered) * self.percentile // 100)]
+            self._thresholds[key] = (at, max(1, len(latencies) // 10))
@@ -0,0 +1,255 @@
+#
+# Copyright 2011 Snitch Incorporated
+#
+# This file is part of AAWS.
+#
+# AAWS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# AAWS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with AAWS.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#               metrics.py,
+#
+#                       This module keeps running totals of the requests AWSRequestManagers make, per
+#                       endpoint host and Action: latency histograms, request, error, retry, throttle and
+#                       byte counts, and how many requests are in flight and queued. They can be read as
+#                       a dict, or as Prometheus text to be scraped and aggregated across many processes:
+#
+#                               registry = aaws.MetricsRegistry()
+#                               registry.attach(manager)
+#                               ...
+#                               print registry.prometheus()
+#
+#
+
+import threading
+import aws
+
+
+class Histogram(object):
+    """Counts of values in log-linear buckets, in the manner of HdrHistogram: values are kept
+            to about 1% (1 / 2 ** (subBits - 1)) of themselves, with a unit of 1 microsecond, in a
+            few hundred buckets at most however widely they range."""
+    __slots__ = ('subBits', 'counts', 'count', 'sum', 'min', 'max')
+
+    def __init__(self, subBits=7):
+        self.subBits = subBits
+        self.counts = {}                # bucket index -> count
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, value):
+        """Count one value (seconds)"""
+        units = int(value * 1e6)
+        if units < 0:
+            units = 0
+        shift = units.bit_length() - self.subBits
+        if shift < 0:
+            shift = 0
+        index = (shift << (self.subBits - 1)) + (units >> shift)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def bounds(self, index):
+        """The range of values (seconds) counted in bucket index"""
+        half = 1 << (self.subBits - 1)
+        if index < half:
+            return index / 1e6, (index + 1) / 1e6
+        shift = index // half - 1
+        sub = index - shift * half
+        return (sub << shift) / 1e6, ((sub + 1) << shift) / 1e6
+
+    def percentile(self, percent):
+        """The value percent of the values are at or below (to the histogram's precision)"""
+        if not self.count:
+            return None
+        rank = max(1, self.count * percent / 100.0)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self.max, max(self.min, self.bounds(index)[1]))
+        return self.max
+
+    def cumulative(self, limits):
+        """The counts of values below each of the ascending limits (seconds). A bucket that spans
+                a limit is counted above it."""
+        counts = [0] * len(limits)
+        for index, count in self.counts.iteritems():
+            upper = self.bounds(index)[1]
+            for i, limit in enumerate(limits):
+                if upper <= limit:
+                    counts[i] += count
+                    break
+        for i in range(1, len(counts)):
+            counts[i] += counts[i - 1]
+        return counts
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'p999': self.percentile(99.9),
+        }
+
+
+class _Stats(object):
+    # the totals for one (host, action)
+    __slots__ = ('requests', 'errors', 'retries', 'throttles', 'cached', 'bytes', 'latency')
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.throttles = 0
+        self.cached = 0
+        self.bytes = 0
+        self.latency = Histogram()
+
+
+class MetricsRegistry(object):
+    """Totals of requests by (endpoint host, Action), kept by observing AWSRequestManagers (see
+            attach). A request without an Action, such as those of S3, is counted under its HTTP
+            verb.
+
+            Every attempt at a request counts in requests, and its latency (from starting to
+            completing, response handler included) in the latency histogram. errors, retries and
+            throttles count the attempts that failed, that were retries, and that failed because
+            AWS throttled them. cached counts requests answered by a manager's cache or by an
+            identical request in flight, which aren't sent; bytes counts response body bytes.
+
+            buckets are the limits (in seconds) of the histogram buckets given to Prometheus.
+            """
+    buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}                # (host, action) -> _Stats
+        self._managers = []
+
+    def attach(self, manager):
+        """Count manager's requests, and include its in flight and queued requests in the gauges"""
+        manager.observers.append(self.observe)
+        self._managers.append(manager)
+
+    def detach(self, manager):
+        manager.observers.remove(self.observe)
+        self._managers.remove(manager)
+
+    def observe(self, request, timing):
+        """AWSRequestManager observer (see timing.Timing)"""
+        key = (request._host, request._action or request._verb)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = _Stats()
+            if timing.started is None:
+                stats.cached += 1
+                return
+            stats.requests += 1
+            stats.latency.record(timing.completed - timing.started)
+            if timing.retry:
+                stats.retries += 1
+            if timing.size is not None:
+                stats.bytes += timing.size
+            if timing.error is not None:
+                stats.errors += 1
+                if aws.isThrottle(timing.error):
+                    stats.throttles += 1
+
+    def gauges(self):
+        """{host: (in flight, queued)} over all the attached managers"""
+        gauges = {}
+        for manager in self._managers:
+            for host, inflight in manager._hostInflight.items():
+                queued = len(manager._queued.get(host, ()))
+                total = gauges.get(host, (0, 0))
+                gauges[host] = (total[0] + inflight, total[1] + queued)
+        return gauges
+
+    def snapshot(self):
+        """The totals as {'hosts': {host: {action: {counts, 'latency': {count, sum, min, max,
+                p50, p90, p99, p999}}}}, 'inflight': {host: n}, 'queued': {host: n}}"""
+        hosts = {}
+        with self._lock:
+            for (host, action), stats in self._stats.iteritems():
+                hosts.setdefault(host, {})[action] = {
+                    'requests': stats.requests,
+                    'errors': stats.errors,
+                    'retries': stats.retries,
+                    'throttles': stats.throttles,
+                    'cached': stats.cached,
+                    'bytes': stats.bytes,
+                    'latency': stats.latency.snapshot(),
+                }
+        gauges = self.gauges()
+        return {
+            'hosts': hosts,
+            'inflight': dict([(host, gauge[0]) for host, gauge in gauges.items()]),
+            'queued': dict([(host, gauge[1]) for host, gauge in gauges.items()]),
+        }
+
+    def prometheus(self):
+        """The totals in the Prometheus text exposition format"""
+        lines = []
+        counters = [
+            ('requests', 'aaws_requests_total', 'Attempts at requests sent'),
+            ('errors', 'aaws_request_errors_total', 'Attempts that failed'),
+            ('retries', 'aaws_request_retries_total', 'Attempts that were retries'),
+            ('throttles', 'aaws_request_throttles_total', 'Attempts that AWS throttled'),
+            ('cached', 'aaws_requests_cached_total', 'Requests answered without being sent'),
+            ('bytes', 'aaws_response_bytes_total', 'Response body bytes received'),
+        ]
+        with self._lock:
+            stats = sorted(self._stats.items())
+            for attr, name, text in counters:
+                lines.append('# HELP %s %s' % (name, text))
+                lines.append('# TYPE %s counter' % name)
+                for (host, action), stat in stats:
+                    lines.append('%s{%s} %d' % (name, _labels(host=host, action=action), getattr(stat, attr)))
+            name = 'aaws_request_duration_seconds'
+            lines.append('# HELP %s Time from starting an attempt to completing it' % name)
+            lines.append('# TYPE %s histogram' % name)
+            for (host, action), stat in stats:
+                histogram = stat.latency
+                for limit, count in zip(self.buckets, histogram.cumulative(self.buckets)):
+                    lines.append('%s_bucket{%s} %d' % (name, _labels(host=host, action=action, le=repr(limit)), count))
+                lines.append('%s_bucket{%s} %d' % (name, _labels(host=host, action=action, le='+Inf'), histogram.count))
+                lines.append('%s_sum{%s} %r' % (name, _labels(host=host, action=action), histogram.sum))
+                lines.append('%s_count{%s} %d' % (name, _labels(host=host, action=action), histogram.count))
+        gauges = sorted(self.gauges().items())
+        for i, name, text in [(0, 'aaws_requests_inflight', 'Requests in flight'), (1, 'aaws_requests_queued', 'Requests waiting for a slot')]:
+            lines.append('# HELP %s %s' % (name, text))
+            lines.append('# TYPE %s gauge' % name)
+            for host, gauge in gauges:
+                lines.append('%s{%s} %d' % (name, _labels(host=host), gauge[i]))
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(**labels):
+    return ','.join(['%s="%s"' % (name, _escape(value)) for name, value in sorted(labels.items())])
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
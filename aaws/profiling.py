@@ -0,0 +1,158 @@
+#
+# Copyright 2011 Snitch Incorporated
+#
+# This file is part of AAWS.
+#
+# AAWS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# AAWS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with AAWS.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#               profiling.py,
+#
+#                       This module profiles where the CPU time of a batch of requests goes: signing,
+#                       making headers, socket I/O, response handlers (XML parsing) and followers, with
+#                       the rest put down to the manager itself. It samples the stack on a CPU time timer
+#                       (SIGPROF), which costs little, and can also run cProfile and save its stats:
+#
+#                               with manager.profile('batch.pstats') as profile:
+#                                   manager.execute()
+#                               print profile.report()
+#
+#
+
+import cProfile
+import collections
+import os
+import pstats
+import signal
+import StringIO
+
+
+# The phase of a sample is that of the innermost of these functions (in this package) on the stack
+PHASES = [
+    ('signing', ('makePath', 'signPath')),
+    ('headers', ('makeHeaders', 'makeRequestHead')),
+    ('handler', ('handle', 'handle_body', 'finishResponse')),
+    ('follow', ('follow',)),
+    ('io', ('handle_read', 'handle_write', 'handle_connect', 'handle_close', 'handle_expt', 'sendRequest',
+                    'start', '_resolved', 'resolve', 'deliver')),
+]
+
+_phaseOf = {}
+for _phase, _names in PHASES:
+    for _name in _names:
+        _phaseOf[_name] = _phase
+
+_package = os.path.dirname(os.path.abspath(__file__))
+
+
+class Profiler(object):
+    """Context manager that samples the calling thread, which must be the main thread (as signals
+            are only handled there), every interval seconds of CPU time. If path is given, cProfile
+            also runs and its stats are saved to path for pstats; it slows everything down, calls
+            of small functions most of all, so the phases are best read from a run without it.
+
+            samples counts the samples taken, phases() and functions() what they found. Timer signals
+            that arrive together are merged, which an interval below the kernel's tick makes common,
+            so the samples are scaled to the process's CPU time (os.times) over the run; cpu is that
+            time once the run is over.
+            """
+
+    def __init__(self, path=None, interval=0.001):
+        self.path = path
+        self.interval = interval
+        self.samples = 0
+        self.cpu = None                 # seconds of CPU time the process used during the run
+        self.stats = None               # pstats.Stats, once a run with cProfile has finished
+        self._phases = collections.defaultdict(int)
+        self._functions = collections.defaultdict(int)   # (file, line, name) -> samples in it
+        self._inPackage = {}            # co_filename -> True if it is one of ours
+        self._profile = None
+        self._handler = None
+        self._started = None
+
+    def __enter__(self):
+        self._handler = signal.signal(signal.SIGPROF, self._sample)
+        signal.siginterrupt(signal.SIGPROF, False)
+        if self.path is not None:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        self._started = os.times()
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        return self
+
+    def __exit__(self, type, value, tb):
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        ended = os.times()
+        self.cpu = (ended[0] - self._started[0]) + (ended[1] - self._started[1])
+        signal.signal(signal.SIGPROF, self._handler)
+        if self._profile is not None:
+            self._profile.disable()
+            self._profile.dump_stats(self.path)
+            self.stats = pstats.Stats(self._profile)
+            self._profile = None
+        return False
+
+    def _sample(self, signum, frame):
+        self.samples += 1
+        code = frame.f_code
+        self._functions[(code.co_filename, code.co_firstlineno, code.co_name)] += 1
+        while frame is not None:
+            code = frame.f_code
+            phase = _phaseOf.get(code.co_name)
+            if phase is not None and self._ours(code.co_filename):
+                self._phases[phase] += 1
+                return
+            frame = frame.f_back
+        self._phases['other'] += 1
+
+    def _ours(self, filename):
+        ours = self._inPackage.get(filename)
+        if ours is None:
+            ours = self._inPackage[filename] = os.path.dirname(os.path.abspath(filename)) == _package
+        return ours
+
+    def _perSample(self):
+        # seconds of CPU time each sample stands for
+        if self.cpu is None or not self.samples:
+            return self.interval
+        return self.cpu / self.samples
+
+    def phases(self):
+        """{phase: seconds of CPU time}, from the samples"""
+        perSample = self._perSample()
+        return dict([(phase, count * perSample) for phase, count in self._phases.items()])
+
+    def functions(self, limit=20):
+        """The functions most often found running, as [((file, line, name), seconds of CPU time)]"""
+        perSample = self._perSample()
+        ranked = sorted(self._functions.items(), key=lambda item: -item[1])[:limit]
+        return [(function, count * perSample) for function, count in ranked]
+
+    def report(self, limit=20):
+        """The phases and busiest functions as text, followed by cProfile's stats if it ran"""
+        out = StringIO.StringIO()
+        total = float(max(1, self.samples))
+        perSample = self._perSample()
+        out.write('%-10s %10s %8s\n' % ('phase', 'cpu secs', 'share'))
+        for phase, count in sorted(self._phases.items(), key=lambda item: -item[1]):
+            out.write('%-10s %10.3f %7.1f%%\n' % (phase, count * perSample, count * 100 / total))
+        out.write('\n%10s %8s  %s\n' % ('cpu secs', 'share', 'function'))
+        for (filename, line, name), count in sorted(self._functions.items(), key=lambda item: -item[1])[:limit]:
+            out.write('%10.3f %7.1f%%  %s (%s:%d)\n' % (count * perSample, count * 100 / total, name,
+                            os.path.basename(filename), line))
+        if self.stats is not None:
+            out.write('\n')
+            self.stats.stream = out
+            self.stats.sort_stats('tottime').print_stats(limit)
+        return out.getvalue()
@@ -43,6 +43,7 @@ class ManagerProxy(object):
     _is_proxy = True
 
     def __init__(self, mgr, service):
+        self._mgr = mgr
         if hasattr(service, '_is_proxy'):
             self._service = service._service
         else:
@@ -58,3 +59,34 @@ class ManagerProxy(object):
         def thunk(*args, **kws):
             mgr.add(method(*args, **kws))
         setattr(self, methname, thunk)
+
+    def map(self, methname, iterable, **kws):
+        """Call the service's methname with each tuple of arguments from iterable, through
+                AWSRequestManager.map"""
+        return self._mgr.map(getattr(self._service, methname), iterable, **kws)
+
+    def imap(self, methname, iterable, **kws):
+        return self._mgr.imap(getattr(self._service, methname), iterable, **kws)
+
+    def imapUnordered(self, methname, iterable, **kws):
+        return self._mgr.imapUnordered(getattr(self._service, methname), iterable, **kws)
+
+
+class TransportProxy(object):
+    _is_proxy = True
+
+    def __init__(self, transport, service):
+        if hasattr(service, '_is_proxy'):
+            self._service = service._service
+        else:
+            self._service = service
+        for methname in dir(self._service):
+            if 'A' <= methname[0] <= 'Z':
+                method = getattr(self._service, methname)
+                if hasattr(method, '__call__'):
+                    self.proxy(transport, methname, method)
+
+    def proxy(self, transport, methname, method):
+        def thunk(*args, **kws):
+            return transport.execute(method(*args, **kws))
+        setattr(self, methname, thunk)
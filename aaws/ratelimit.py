@@ -0,0 +1,129 @@
+#
+# Copyright 2011 Snitch Incorporated
+#
+# This file is part of AAWS.
+#
+# AAWS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# AAWS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with AAWS.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#               ratelimit.py,
+#
+#                       This module paces requests so they stay under AWS's throttling limits, rather
+#                       than bursting, getting 503s and backing off. Limits are set for an endpoint host,
+#                       Action and access key, any of which may be left as a wildcard, and each limit has
+#                       one token bucket, shared by every request it matches. For example, to keep all
+#                       CloudWatch PutMetricData calls, whatever the endpoint or key, to 20 a second:
+#
+#                               manager.limiter.setLimit(20, action='PutMetricData')
+#
+#
+
+import time
+
+
+class TokenBucket(object):
+    """Holds up to burst tokens, refilled at rate a second. The count goes negative when tokens
+            are reserved ahead of time."""
+    __slots__ = ('rate', 'burst', 'tokens', 'stamp')
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.time()
+
+    def reserve(self, now):
+        """Take a token, and return how many seconds from now it is available"""
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate) - 1
+        self.stamp = now
+        if self.tokens >= 0:
+            return 0
+        return -self.tokens / self.rate
+
+    def take(self, now):
+        """Take a token if one is available now, and return whether it was"""
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class RateLimiter(object):
+    """Token bucket limits keyed by (host, Action, access key). A request is limited by the most
+            specific limit that matches it, and shares that limit's bucket with every other request it
+            matches, so a limit for a host alone paces all of the host's Actions together."""
+
+    # limits are matched against these fields of the request's key, most specific first
+    _patterns = [(True, True, True), (True, True, False), (False, True, True), (True, False, True),
+                    (False, True, False), (True, False, False), (False, False, True), (False, False, False)]
+
+    def __init__(self):
+        self._limits = {}               # (host, action, key), None for any -> (rate, burst)
+        self._buckets = {}              # (host, action, key) -> TokenBucket, or None if unlimited
+        self._shared = {}               # limit's (host, action, key) -> its TokenBucket
+
+    def setLimit(self, rate, burst=None, host=None, action=None, key=None):
+        """Limit requests to rate a second, after an initial burst (by default one second's worth).
+                host, action and key narrow the limit to an endpoint, Action and access key. A rate
+                of None removes the limit."""
+        if rate is None:
+            self._limits.pop((host, action, key), None)
+        else:
+            if burst is None:
+                burst = max(rate, 1)
+            self._limits[(host, action, key)] = (rate, burst)
+        self._buckets = {}
+        self._shared = {}
+
+    def reserve(self, request, now=None):
+        """Take a token for request, and return how many seconds from now it may be started"""
+        if not self._limits:
+            return 0
+        bucket = self._bucket(request)
+        if bucket is None:
+            return 0
+        if now is None:
+            now = time.time()
+        return bucket.reserve(now)
+
+    def take(self, request, now=None):
+        """Take a token for request only if it may be started at once, and return whether it may"""
+        if not self._limits:
+            return True
+        bucket = self._bucket(request)
+        if bucket is None:
+            return True
+        if now is None:
+            now = time.time()
+        return bucket.take(now)
+
+    def _bucket(self, request):
+        key = (request._host, request._action, request._key)
+        bucket = self._buckets.get(key, False)
+        if bucket is False:
+            bucket = self._buckets[key] = self._bucketFor(key)
+        return bucket
+
+    def _bucketFor(self, key):
+        for pattern in self._patterns:
+            limitKey = tuple([field if match else None for field, match in zip(key, pattern)])
+            limit = self._limits.get(limitKey)
+            if limit is not None:
+                bucket = self._shared.get(limitKey)
+                if bucket is None:
+                    bucket = self._shared[limitKey] = TokenBucket(*limit)
+                return bucket
+        return None
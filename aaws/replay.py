@@ -0,0 +1,316 @@
+#
+# Copyright 2011 Snitch Incorporated
+#
+# This file is part of AAWS.
+#
+# AAWS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# AAWS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with AAWS.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#               replay.py,
+#
+#                       This module records the raw HTTP exchanges of real runs, and plays them back to
+#                       AWSRequestManagers without any network, so that the manager, the signers and each
+#                       service's response handlers can be benchmarked and tested on real payloads
+#                       anywhere. Requests are still built, signed and sent (into a buffer), and responses
+#                       are read and parsed from a socket exactly as they would be from AWS; only the other
+#                       end of the socket is a recording, delayed and throttled as asked:
+#
+#                               with aaws.Recorder('sqs.rec') as recorder:
+#                                   recorder.attach(manager)
+#                                   manager.execute()
+#
+#                               replayer = aaws.Replayer('sqs.rec', latency=0.02, bandwidth=1e6)
+#                               replayer.attach(manager)
+#
+#
+
+import gzip
+import heapq
+import itertools
+import json
+import os
+import select
+import socket
+import threading
+import time
+import urlparse
+import aws
+from request import AWSConnection
+
+
+# Parameters that change each time a request is signed, and so don't identify it
+_VOLATILE = frozenset(('Timestamp', 'Expires', 'Signature'))
+
+
+def exchangeKey(sent):
+    """What a raw request is replayed for: its verb, Host, path, parameters (less the ones that
+            change whenever it is signed) and body"""
+    head, _, body = sent.partition('\r\n\r\n')
+    lines = head.split('\r\n')
+    verb, target = lines[0].split(' ')[:2]
+    host = None
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        if name.strip().lower() == 'host':
+            host = value.strip()
+    path, _, query = target.partition('?')
+    parameters = [item for item in urlparse.parse_qsl(query, True) if item[0] not in _VOLATILE]
+    return verb, host, path, tuple(sorted(parameters)), body
+
+
+class Recorder(object):
+    """Records the exchanges of the managers it is attached to in a file at path: for each, a JSON
+            line with its latency (seconds from sending the request to the first byte of the
+            response) and lengths, then the request and response as sent and received, the whole
+            file gzipped. Only exchanges that get a complete response are recorded."""
+
+    def __init__(self, path):
+        self.path = path
+        self.recorded = 0
+        self._file = gzip.open(path, 'wb')
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, tb):
+        self.close()
+        return False
+
+    def attach(self, manager):
+        manager.connectionFactory = self._connection
+
+    def detach(self, manager):
+        manager.connectionFactory = AWSConnection
+
+    def _connection(self, request, manager, _map):
+        return _RecordingConnection(self, request, manager, _map)
+
+    def record(self, sent, received, latency):
+        header = json.dumps({'latency': round(latency, 6), 'request': len(sent), 'response': len(received)})
+        with self._lock:
+            self._file.write(header + '\n')
+            self._file.write(sent)
+            self._file.write(received)
+            self.recorded += 1
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class _RecordingConnection(AWSConnection):
+    # an AWSConnection that keeps a copy of everything sent and received
+
+    def __init__(self, recorder, request, manager, _map):
+        AWSConnection.__init__(self, request, manager, _map)
+        self._recorder = recorder
+
+    def _resetResponse(self):
+        AWSConnection._resetResponse(self)
+        self._sent = []
+        self._received = []
+        self._sentAt = None
+        self._firstByteAt = None
+
+    def send(self, data):
+        self._sent.append(data)
+        return AWSConnection.send(self, data)
+
+    def sendRequest(self):
+        self._sentAt = time.time()
+        AWSConnection.sendRequest(self)
+
+    def recv(self, size):
+        data = AWSConnection.recv(self, size)
+        self._received.append(data)
+        if self._firstByteAt is None:
+            self._firstByteAt = time.time()
+        return data
+
+    def _recvInto(self, buf, size):
+        size = AWSConnection._recvInto(self, buf, size)
+        self._received.append(buf[:size].tobytes())
+        return size
+
+    def _complete(self):
+        latency = (self._firstByteAt or time.time()) - self._sentAt
+        self._recorder.record(''.join(self._sent), ''.join(self._received), latency)
+        AWSConnection._complete(self)
+
+
+class Replayer(object):
+    """Answers the requests of the managers it is attached to from a Recorder's file, instead of
+            sending them. A request is answered with a recorded response to an identical request
+            (see exchangeKey); if there were several they are used in turn, starting over after the
+            last. A request with no recorded response fails with AWSError.
+
+            latency -- seconds before a response starts to arrive: None for the recorded latency, a
+                    number, or a function of the request.
+            bandwidth -- bytes a second each response arrives at, None for as fast as it is read.
+
+            replayed and missed count the requests answered and not.
+            """
+
+    def __init__(self, path, latency=None, bandwidth=None):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.replayed = 0
+        self.missed = 0
+        self._exchanges = {}            # exchangeKey -> [(latency, response)]
+        self._next = {}                 # exchangeKey -> index of the response to use next
+        self._lock = threading.Lock()
+        self._wire = _Wire()
+        self._load(path)
+
+    def __len__(self):
+        return sum([len(responses) for responses in self._exchanges.itervalues()])
+
+    def _load(self, path):
+        f = gzip.open(path, 'rb')
+        try:
+            while True:
+                line = f.readline()
+                if not line:
+                    break
+                header = json.loads(line)
+                sent = f.read(header['request'])
+                received = f.read(header['response'])
+                self._exchanges.setdefault(exchangeKey(sent), []).append((header['latency'], received))
+        finally:
+            f.close()
+
+    def attach(self, manager):
+        manager.connectionFactory = self._connection
+
+    def detach(self, manager):
+        manager.connectionFactory = AWSConnection
+
+    def _connection(self, request, manager, _map):
+        return _ReplayConnection(self, request, manager, _map)
+
+    def respond(self, request, sent, sock):
+        """Play the response recorded for sent, the raw request, into sock. False if there is none."""
+        key = exchangeKey(sent)
+        with self._lock:
+            responses = self._exchanges.get(key)
+            if responses is None:
+                self.missed += 1
+                return False
+            idx = self._next.get(key, 0)
+            self._next[key] = (idx + 1) % len(responses)
+            self.replayed += 1
+        latency, response = responses[idx]
+        if self.latency is not None:
+            latency = self.latency(request) if callable(self.latency) else self.latency
+        self._wire.deliver(sock, response, latency, self.bandwidth)
+        return True
+
+
+class _ReplayConnection(AWSConnection):
+    # an AWSConnection to one end of a socket pair, with the recording at the other
+
+    def __init__(self, replayer, request, manager, _map):
+        AWSConnection.__init__(self, request, manager, _map)
+        self._replayer = replayer
+        self._sent = []
+        self._peer = None
+        self._missing = False
+
+    def start(self):
+        self._resetResponse()
+        sock, self._peer = socket.socketpair()
+        sock.setblocking(0)
+        self.set_socket(sock)
+        self.connected = True
+        self.sendRequest()
+        if not self._replayer.respond(self._request, ''.join(self._sent), self._peer):
+            # fail once the loop sees the other end shut, not in the middle of being started
+            self._missing = True
+            self._replayer._wire.deliver(self._peer, '', 0, None)
+
+    def send(self, data):
+        self._sent.append(data)         # nothing listens for it
+        return len(data)
+
+    def close(self):
+        AWSConnection.close(self)
+        if self._peer is not None:
+            self._peer.close()
+            self._peer = None
+
+    def _release(self):
+        self.close()                    # nothing to pool
+
+    def handle_close(self):
+        if self._missing and self.socket is not None:
+            self.close()
+            self._manager.reqComplete(self._request, False, aws.AWSError(-1, 'no recorded response', self._request))
+        else:
+            AWSConnection.handle_close(self)
+
+
+class _Wire(object):
+    # Writes responses into the other ends of replay sockets on a thread of its own, at the times
+    # their latency and bandwidth say they would arrive, then shuts them down for writing (which
+    # the reader sees as end of file, where closing them outright is seen as a hangup that cuts
+    # short reading what was sent)
+
+    quantum = 0.005                     # seconds of bandwidth limited data written at once
+
+    def __init__(self):
+        self._pending = []              # heap of (when, seq, sock, data, last)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._wakeRead, self._wakeWrite = os.pipe()
+        self._thread = None
+
+    def deliver(self, sock, data, latency, bandwidth):
+        start = time.time() + latency
+        if bandwidth is None:
+            chunks = [(start, data)]
+        else:
+            size = max(1, int(bandwidth * self.quantum))
+            chunks = [(start + (offset + len(data[offset:offset + size])) / float(bandwidth), data[offset:offset + size])
+                            for offset in range(0, len(data), size)] or [(start, '')]
+        with self._lock:
+            for i, (when, chunk) in enumerate(chunks):
+                heapq.heappush(self._pending, (when, self._seq.next(), sock, chunk, i == len(chunks) - 1))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='aaws replay')
+                self._thread.daemon = True
+                self._thread.start()
+        os.write(self._wakeWrite, 'x')
+
+    def _run(self):
+        while True:
+            with self._lock:
+                now = time.time()
+                due = []
+                while self._pending and self._pending[0][0] <= now:
+                    due.append(heapq.heappop(self._pending))
+                wait = self._pending[0][0] - now if self._pending else None
+            for _, _, sock, data, last in due:
+                try:
+                    sock.sendall(data)
+                except socket.error:
+                    pass                # the reader has gone (timed out or aborted)
+                if last:
+                    try:
+                        sock.shutdown(socket.SHUT_WR)
+                    except socket.error:
+                        pass
+            if not due:
+                if select.select([self._wakeRead], [], [], wait)[0]:
+                    os.read(self._wakeRead, 4096)
@@ -34,15 +34,43 @@ import base64
 import time
 import httplib
 import asyncore
-import StringIO
-import mimetools
 import socket
+import errno
 import sys
+import collections
+import heapq
+import itertools
+import random
+import threading
+import copy
+import traceback
+from xml.etree import ElementTree as ET
 import aws
 import proxy
+import connection
+import ratelimit
+import profiling
+from resolver import Resolver
+from future import Future
+from timing import Timing
+import eventloop
 
 DEBUG = False
 
+# cache.ResponseCache used by managers not given one of their own, and by GET()
+responseCache = None
+
+# resolver.Resolver used by managers not given one of their own, so that they share its lookups
+defaultResolver = Resolver()
+
+# Actions with these prefixes only read, so sending one twice does no harm
+READ_PREFIXES = ('Get', 'Describe', 'List')
+
+# Parameters that are added when a request is signed, and don't change what it asks for
+_SIGNING = frozenset(('Action', 'AWSAccessKeyId', 'SignatureMethod', 'SignatureVersion', 'Timestamp', 'Expires', 'Signature'))
+
+_DISCONNECTED = frozenset((errno.ECONNRESET, errno.ENOTCONN, errno.ESHUTDOWN, errno.ECONNABORTED, errno.EPIPE, errno.EBADF))
+
 def compact_traceback():
     t, v, tb = sys.exc_info()
     tbinfo = []
@@ -60,79 +88,748 @@ def compact_traceback():
     return (file, function, line), t, v, info
 
 
+class Signer(object):
+    """SignatureVersion 2 (HmacSHA256) signing state for one set of credentials. Keeps an HMAC
+            already keyed with the secret to copy for each signature, the quoted form of parameter
+            names (which repeat a lot, e.g. Item.N.Attribute.M.Name), and the Timestamp string for
+            the current second.
+            """
+    maxNames = 10000            # quoted names remembered before the memo is emptied
+
+    def __init__(self, key, secret):
+        self.key = key
+        self._hmac = hmac.new(secret, digestmod=hashlib.sha256)
+        self._names = {}
+        self._second = None
+        self._timestamp = None
+
+    def timestamp(self):
+        now = int(time.time())
+        if now != self._second:
+            self._timestamp = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(now))
+            self._second = now
+        return self._timestamp
+
+    def quoteName(self, name):
+        quoted = self._names.get(name)
+        if quoted is None:
+            if len(self._names) >= self.maxNames:
+                self._names.clear()
+            quoted = self._names[name] = urllib.quote(name, safe='')
+        return quoted
+
+    def signPath(self, host, path, parameters):
+        """Return path with the canonical, signed query string for parameters appended"""
+        quoteName = self.quoteName
+        quote = urllib.quote
+        query = '&'.join([quoteName(key) + '=' + quote(parameters[key], safe='-_~') for key in sorted(parameters)])
+        h = self._hmac.copy()
+        h.update('GET\n%s\n%s\n%s' % (host, path, query))
+        return '%s?%s&Signature=%s' % (path, query, quote(base64.b64encode(h.digest()), safe='-_~'))
+
+
+_signers = {}
+
+def getSigner(key, secret):
+    """Return the shared Signer for these credentials"""
+    signer = _signers.get((key, secret))
+    if signer is None:
+        signer = _signers[(key, secret)] = Signer(key, secret)
+    return signer
+
+
 class AWSRequestManager(object):
+    """Runs AWSRequests asynchronously. Added requests are queued and started as slots free up,
+            so that no more than maxInFlight requests (and maxPerHost to any one endpoint) have a
+            socket open at once. Either limit may be None for no limit.
+
+            A request fails with socket.timeout if it takes longer than connectTimeout seconds to
+            connect, or if its connection then goes readTimeout seconds without sending or receiving
+            anything. AWSRequest.connectTimeout and readTimeout override these for one request.
+
+            execute() retries failures that aws.isRetryable accepts after a random delay of up to
+            backoff * 2 ** attempt seconds (capped at maxBackoff), and gives up at once on the rest.
+            asCompleted() does the same, but hands back each request as soon as it is done.
+
+            For a steady stream of requests, leave the manager running with serve() (on the calling
+            thread) or start() (on a thread of its own), and submit() requests from any thread; each
+            gets a Future. Connections, lookups and backoff carry over from one request to the next.
+            Don't call run(), execute() or clear() while it is serving.
+
+            Endpoint names are looked up by a resolver.Resolver, off the loop's thread, and cached.
+            Unless one is given, managers share request.defaultResolver and its cache.
+
+            backend is the eventloop backend used to wait on sockets, by default the best one for the
+            platform (epoll on Linux).
+
+            concurrency, if given, is a concurrency.AIMD that adjusts how many requests may be in flight
+            to each endpoint from their latency and throttling (never more than maxPerHost).
+
+            hedging, if given, is a hedge.Hedger: idempotent reads that take unusually long are sent a
+            second time, and whichever copy answers first is used.
+
+            If coalesce is True, an idempotent request that is identical to one already queued or in
+            flight (see AWSRequest.identity) isn't sent, but shares the other's response. coalesced
+            counts the requests that did.
 
-    def __init__(self):
+            cache, if given (by default request.responseCache), is a cache.ResponseCache: requests it
+            holds a fresh result for complete at once, without being sent.
+
+            observers is a list of callables, each called as observer(request, timing) whenever an
+            attempt at a request completes, with the timing.Timing of its phases. Timings are only
+            recorded while there are observers.
+
+            connectionFactory makes the AWSConnection that carries each attempt, as
+            connectionFactory(request, manager, _map). replay.Recorder and replay.Replayer replace it
+            to record exchanges, or to play recorded ones back without any network.
+
+            limiter is the ratelimit.RateLimiter that paces requests as they are started, keeping them
+            under AWS's throttling limits. It has no limits until some are set with limiter.setLimit.
+            """
+    tick = 0.5                  # seconds between checks for timed out requests
+
+    def __init__(self, pool=None, maxInFlight=128, maxPerHost=32, connectTimeout=10.0, readTimeout=60.0,
+                    backoff=0.1, maxBackoff=20.0, resolver=None, backend=None, limiter=None,
+                    concurrency=None, hedging=None, coalesce=False, cache=None, observers=None):
+        self._owned = []                # what was made here rather than passed in, for close()
+        if pool is None:
+            pool = connection.ConnectionPool()
+            self._owned.append(pool)
+        self._pool = pool
+        if resolver is None:
+            resolver = defaultResolver
+        self._resolver = resolver
+        if backend is None:
+            backend = eventloop.default()
+            if hasattr(backend, 'close'):
+                self._owned.append(backend)
+        self._backend = backend
+        if limiter is None:
+            limiter = ratelimit.RateLimiter()
+        self.limiter = limiter
+        self.concurrency = concurrency
+        self.hedging = hedging
+        self.coalesce = coalesce
+        self.coalesced = 0
+        if cache is None:
+            cache = responseCache
+        self.cache = cache
+        self.observers = list(observers or [])
+        self.connectionFactory = AWSConnection
+        self.maxInFlight = maxInFlight
+        self.maxPerHost = maxPerHost
+        self.connectTimeout = connectTimeout
+        self.readTimeout = readTimeout
+        self.backoff = backoff
+        self.maxBackoff = maxBackoff
+        self._seq = itertools.count()
+        self._submitted = collections.deque()   # (request, future, retries, follow) from submit()
+        self._submitLock = threading.Lock()
+        self._waker = eventloop.Waker(self._takeSubmitted)
+        self._stopping = False
+        self._thread = None
+        self._map = None
         self.clear()
 
+    def close(self):
+        """Release the connections and file descriptors the manager holds, once it is done with.
+                A pool or backend that was passed in is left for its owner to close, as is the
+                resolver, which is shared. Don't call it while the manager is serving."""
+        self._resolver.forget(self._map)
+        self._waker.close()
+        for owned in self._owned:
+            owned.close()
+        self._owned = []
+
     def clear(self):
+        if self._map is not None:
+            self._resolver.forget(self._map)   # lookups still under way are for abandoned requests
         self._map = {}
-        self._incomplete = []
+        self._incomplete = {}           # id(request) -> request, for every request added and not complete
         self._good = []
         self._bad = []
+        self._queued = {}               # host -> deque of requests waiting for a slot
+        self._runnable = collections.deque()    # hosts with queued requests and a free per host slot
+        self._runnableHosts = set()             # the hosts in _runnable
+        self._inflight = 0
+        self._hostInflight = {}
+        self._active = {}               # id(request) -> request, for those started and not completed
+        self._scheduling = False
+        self._delayed = []              # heap of (when, seq, request) waiting to be queued
+        self._hedgeTimers = []          # heap of (when, seq, request, conn) to hedge if still running
+        self._leaders = {}              # identity -> the request that will be sent for it, when coalescing
+        self._hits = collections.deque()        # (request, result) answered from the cache
+        self._done = collections.deque()        # requests execute() has settled, waiting to be yielded
+        self._errors = []
+        self._nextCheck = 0
 
     def add(self, request):
-        request.ExecAsync(self, self._map)
-        self._incomplete.append(request)
+        self._track(request)
+        self._enqueue(request)
+
+    def addLater(self, request, delay):
+        """Add a request, but don't queue it to start until delay seconds from now"""
+        self._track(request)
+        heapq.heappush(self._delayed, (time.time() + delay, self._seq.next(), request))
+
+    def _track(self, request):
+        _checkPlain(request)
+        self._incomplete[id(request)] = request
+        if not request._settle:
+            request._idx = self._seq.next()     # execute() returns requests in this order
+
+    def submit(self, request, retries=5, follow=10):
+        """Queue request to be executed, as by execute(), by the running loop, and return a Future
+                for its result. May be called from any thread."""
+        _checkPlain(request)
+        future = Future(request)
+        with self._submitLock:
+            self._submitted.append((request, future, retries, follow))
+        self._waker.wake()
+        return future
+
+    def _takeSubmitted(self):
+        # on the loop's thread, once woken by submit()
+        while True:
+            with self._submitLock:
+                if not self._submitted:
+                    return
+                request, future, retries, follow = self._submitted.popleft()
+            self._prepare(request, retries, follow)
+            request._future = future
+            self.add(request)
+
+    def serve(self):
+        """Run the loop on this thread, executing submitted requests, until stop() is called"""
+        self._nextCheck = time.time() + self.tick
+        lastPrune = time.time()
+        try:
+            while not self._stopping:
+                self._waker.attach(self._map)
+                self._takeSubmitted()
+                self._poll(None)
+                if time.time() - lastPrune > self.tick:
+                    self._pool.prune()
+                    lastPrune = time.time()
+        finally:
+            self._waker.detach()
+            self._stopping = False
+
+    def start(self):
+        """Run serve() on a background thread"""
+        self._thread = threading.Thread(target=self.serve, name='aaws-manager')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, wait=True):
+        """Make serve() return, once it has finished handling whatever it is doing. Requests
+                in flight are left as they are, and continue if the manager is served again. If
+                wait is True and start() was used, wait for its thread to exit."""
+        self._stopping = True
+        self._waker.wake()
+        thread = self._thread
+        if wait and thread is not None and thread is not threading.current_thread():
+            thread.join()
+            self._thread = None
+
+    def getBackoff(self, attempt):
+        """Seconds to wait before the attempt'th retry of a request (full jitter)"""
+        return random.uniform(0, min(self.maxBackoff, self.backoff * 2 ** attempt))
+
+    def _enqueue(self, request):
+        if not request._paced:
+            # a paced request already went through these on its way to the limiter, and is only
+            # coming back for its reserved slot
+            if self.observers:
+                request._timing = Timing(time.time(), request._timing)
+            if self.cache is not None:
+                result = self.cache.lookup(request)
+                if result is not None:
+                    self._hits.append((request, result))    # completed by the loop, like any other
+                    return
+            if self.coalesce and request._hedgeOf is None and request.idempotent():
+                identity = request.identity()
+                leader = self._leaders.get(identity)
+                if leader is not None:
+                    # ride along with the identical request that is already going out
+                    if leader._riders is None:
+                        leader._riders = []
+                    leader._riders.append(request)
+                    self.coalesced += 1
+                    return
+                self._leaders[identity] = request
+                request._identity = identity
+        queue = self._queued.get(request._host)
+        if queue is None:
+            queue = self._queued[request._host] = collections.deque()
+        if request._paced:
+            queue.appendleft(request)           # it has already waited its turn
+        else:
+            queue.append(request)
+        self._markRunnable(request._host)
+        self._schedule()
+
+    def _hostFull(self, host):
+        inflight = self._hostInflight.get(host, 0)
+        if self.concurrency is not None and inflight >= self.concurrency.limit(host):
+            return True
+        return self.maxPerHost is not None and inflight >= self.maxPerHost
+
+    def _markRunnable(self, host):
+        if host not in self._runnableHosts and self._queued.get(host) and not self._hostFull(host):
+            self._runnable.append(host)
+            self._runnableHosts.add(host)
+
+    def _schedule(self):
+        # Start queued requests, round robin across hosts, while there are free slots. Requests
+        # that complete while we are starting others (e.g. failing to connect) re-enter here,
+        # so the outer call does the work.
+        if self._scheduling:
+            return
+        self._scheduling = True
+        try:
+            while self._runnable and (self.maxInFlight is None or self._inflight < self.maxInFlight):
+                host = self._runnable.popleft()
+                self._runnableHosts.discard(host)
+                if self._hostFull(host):
+                    continue                    # its limit has been cut since; _finished marks it again
+                queue = self._queued[host]
+                request = queue.popleft()
+                if not request._paced:
+                    delay = self.limiter.reserve(request)
+                    if delay > 0:
+                        # wait for the token that has been reserved, without holding up the host
+                        request._paced = True
+                        heapq.heappush(self._delayed, (time.time() + delay, self._seq.next(), request))
+                        self._markRunnable(host)
+                        continue
+                request._paced = False
+                self._inflight += 1
+                self._hostInflight[host] = self._hostInflight.get(host, 0) + 1
+                self._markRunnable(host)
+                request._started = True
+                if self.concurrency is not None or self.hedging is not None:
+                    request._startedAt = time.time()
+                if request._timing is not None:
+                    request._timing.started = time.time()
+                self._active[id(request)] = request
+                try:
+                    request.ExecAsync(self, self._map)
+                except socket.error, e:
+                    if request._conn is not None:
+                        request._conn.close()
+                    self.reqComplete(request, False, e)
+                    continue
+                if self.hedging is not None and request._started and self.hedging.hedgeable(request):
+                    delay = self.hedging.delay(request)
+                    if delay is not None:
+                        heapq.heappush(self._hedgeTimers, (request._startedAt + delay, self._seq.next(), request, request._conn))
+        finally:
+            self._scheduling = False
+
+    def _hedge(self, request):
+        # start a duplicate of request, which has been running too long
+        if self.maxInFlight is not None and self._inflight >= self.maxInFlight:
+            return
+        if self._hostFull(request._host):
+            return                      # the host's limit (or AIMD's) applies to hedges too
+        if not self.hedging.allow() or not self.limiter.take(request):
+            return                      # nor send extra load to a host that is being paced
+        hedge = request.duplicate()
+        hedge._hedgeOf = request
+        request._hedge = hedge
+        self._incomplete[id(hedge)] = hedge
+        self._inflight += 1
+        self._hostInflight[hedge._host] += 1
+        hedge._started = True
+        hedge._startedAt = time.time()
+        if self.observers:
+            hedge._timing = Timing(hedge._startedAt)
+            hedge._timing.started = hedge._startedAt
+        self._active[id(hedge)] = hedge
+        try:
+            hedge.ExecAsync(self, self._map)
+        except socket.error, e:
+            if hedge._conn is not None:
+                hedge._conn.close()
+            self.reqComplete(hedge, False, e)
+
+    def _hedgeComplete(self, request, success, result):
+        # One of a hedged pair has finished. Returns the original request, to be completed with
+        # this outcome, or None if the other copy is still running and may yet succeed.
+        primary = request._hedgeOf or request
+        hedge = primary._hedge
+        other = hedge if request is primary else primary
+        if request._started:
+            self._ended(request, success, result)
+        if not success and other._started:
+            if request is hedge:
+                self._unhedge(primary)
+            return None
+        if other._started:
+            if other._conn is not None:
+                other._conn.close()
+            self._finished(other)
+        self._unhedge(primary)
+        if request is hedge and success:
+            self.hedging.won += 1
+            primary._size = request._size
+            primary._timing = request._timing
+        return primary
+
+    def _unhedge(self, primary):
+        hedge = primary._hedge
+        primary._hedge = None
+        hedge._hedgeOf = None
+        self._incomplete.pop(id(hedge), None)
+
+    def _finished(self, request):
+        # release the slot held by a started request, and start whatever can use it
+        host = request._host
+        request._started = False
+        request._conn = None
+        request._response = None
+        del self._active[id(request)]
+        self._inflight -= 1
+        self._hostInflight[host] -= 1
+        self._markRunnable(host)
+        self._schedule()
+
+    def _ended(self, request, success, result):
+        # a started request has finished: tell the concurrency controller and hedging policy how
+        # it went, and release its slot
+        host = request._host
+        if self.concurrency is not None:
+            if success:
+                self.concurrency.success(host, time.time() - request._startedAt, self._hostInflight[host])
+            elif aws.isThrottle(result) or isinstance(result, socket.timeout):
+                self.concurrency.throttled(host)
+        if success and self.hedging is not None:
+            self.hedging.record(request, time.time() - request._startedAt)
+        self._finished(request)
 
     def addService(self, name, service):
         setattr(self, name, proxy.ManagerProxy(self, service))
 
     def reqComplete(self, request, success, result):
-        if request in self._incomplete:
-            self._incomplete.remove(request)
+        if request._hedge is not None or request._hedgeOf is not None:
+            request = self._hedgeComplete(request, success, result)
+            if request is None:
+                return
+        if self._incomplete.pop(id(request), None) is not None:
             request.result = result
-            if success:
+            if request._started:
+                self._ended(request, success, result)
+            if self.cache is not None:
+                self._cacheResult(request, success, result)
+            if request._timing is not None:
+                self._observe(request, success, result)
+            riders = None
+            if request._identity is not None:
+                riders = self._unlead(request)
+            if request._settle:
+                self._settle(request, success)
+            elif success:
                 self._good.append(request)
             else:
                 self._bad.append(request)
+            if riders is not None:
+                for rider in riders:
+                    self.reqComplete(rider, success, result)
+
+    def _cacheResult(self, request, success, result):
+        # keep a response that came over the wire for later requests, and drop what it made stale
+        size, request._size = request._size, None
+        self.cache.invalidate(request)
+        if success and size is not None:
+            self.cache.store(request, result, size)
+
+    def _observe(self, request, success, result):
+        timing = request._timing
+        timing.completed = time.time()
+        if not success:
+            timing.error = result
+        for observer in self.observers:
+            try:
+                observer(request, timing)
+            except Exception:
+                traceback.print_exc()
+
+    def _unlead(self, request):
+        # request's response is in: stop coalescing new requests onto it, and return its riders
+        if self._leaders.get(request._identity) is request:
+            del self._leaders[request._identity]
+        request._identity = None
+        riders, request._riders = request._riders, None
+        return riders
+
+    def _prepare(self, request, retries, follow):
+        # Put a request under execute()'s control: from now on each completion is settled as it
+        # happens (followed, retried or finished) instead of being left in good or bad for run()
+        if request._follows is None:
+            request._follows = follow
+        if request._retries is None:
+            request._retries = retries
+        request._following = bool(follow)
+        request._attempt = 0
+        request._accum = None
+        request._failed = False
+        request._errors = []
+        request._settle = True
+
+    def _settle(self, request, success):
+        if success:
+            if not request._following:
+                self._settled(request)
+                return
+            try:
+                more = request.follow(request)
+            except Exception, e:
+                # called from the loop's callbacks, so it must not escape: asyncore would hand it
+                # to the connection, after the request was already completed, and it would be lost
+                self._error(request, e)
+                request._failed = True
+                self._settled(request)
+                return
+            if more:
+                request._follows -= 1
+                if request._follows < 0:
+                    self._error(request, aws.AWSError(-1, 'follows exceeded', request))
+                    request._failed = True
+                    self._settled(request)
+                else:
+                    self.add(request)
+            else:
+                request.result = request._accum
+                self._settled(request)
+            return
+        self._error(request, request.result)
+        request._retries -= 1
+        if request._retries < 0 or not aws.isRetryable(request.result):
+            request._failed = True
+            self._settled(request)
+        else:
+            self.addLater(request, self.getBackoff(request._attempt))
+            request._attempt += 1
+
+    def _error(self, request, error):
+        # a submitted request's errors are its own, execute() reports all of the batch's together
+        if request._future is not None:
+            request._errors.append(error)
+        else:
+            self._errors.append(error)
+
+    def _settled(self, request):
+        future = request._future
+        if future is None:
+            self._done.append(request)
+            return
+        request._future = None
+        request._settle = False
+        if request._failed:
+            future._set(None, aws.AWSCompoundError(request._errors))
+        else:
+            future._set(request.result, None)
+
+    def _checkTimeouts(self, now):
+        for request in self._active.values():
+            conn = request._conn
+            if conn is None:
+                continue
+            if conn.connected:
+                limit = request.readTimeout if request.readTimeout is not None else self.readTimeout
+                what = 'read timed out'
+            else:
+                limit = request.connectTimeout if request.connectTimeout is not None else self.connectTimeout
+                what = 'connect timed out'
+            if limit is not None and now - conn._lastIO > limit:
+                conn.close()
+                self.reqComplete(request, False, socket.timeout(what))
+
+    def _abort(self):
+        # Close every request that is in flight and put it back at the head of its host's queue,
+        # so that a later run() starts it again.
+        for request in self._active.values():
+            if request._conn is not None:
+                request._conn.close()
+            host = request._host
+            request._started = False
+            request._conn = None
+            request._response = None
+            self._inflight -= 1
+            self._hostInflight[host] -= 1
+            primary = request._hedgeOf
+            if primary is not None:
+                # drop the hedge; if the original had already failed and was waiting on it, it
+                # goes back in the queue instead
+                self._unhedge(primary)
+                if id(primary) in self._active or id(primary) not in self._incomplete:
+                    continue
+                request = primary
+            self._queued[host].appendleft(request)
+        self._active = {}
+        self._runnable = collections.deque()
+        self._runnableHosts = set()
+        for host in self._queued:
+            self._markRunnable(host)
+
+    def _poll(self, deadline):
+        # Start delayed requests that are due, wait once for socket activity (or until the next
+        # delayed request or the deadline) and check for timeouts. False if the deadline has passed.
+        if self._hits:
+            while self._hits:
+                request, result = self._hits.popleft()
+                self.reqComplete(request, True, result)
+            return True
+        now = time.time()
+        while self._delayed and self._delayed[0][0] <= now:
+            self._enqueue(heapq.heappop(self._delayed)[2])
+        while self._hedgeTimers and self._hedgeTimers[0][0] <= now:
+            _, _, request, conn = heapq.heappop(self._hedgeTimers)
+            if request._conn is conn and request._started and request._hedge is None:
+                self._hedge(request)
+        wait = self.tick
+        if self._delayed:
+            wait = min(wait, self._delayed[0][0] - now)
+        if self._hedgeTimers:
+            wait = min(wait, self._hedgeTimers[0][0] - now)
+        if deadline is not None:
+            wait = min(wait, deadline - now)
+            if wait <= 0:
+                return False
+        if self._map:
+            self._backend(wait, self._map)
+        elif wait > 0:
+            time.sleep(wait)
+        now = time.time()
+        if now >= self._nextCheck:
+            self._checkTimeouts(now)
+            self._nextCheck = now + self.tick
+        return True
 
     def run(self, timeout=None):
-        """Process all added requests until they are complete or timeout is reached (if supplied)"""
-        # XXX: timeout not supported yet, supplying timeout to loop will not work
-        asyncore.loop(map=self._map)
-        return self._good, self._bad, self._incomplete
-
-    def execute(self, retries=5, follow=10):
-        def byIndex(l, r):
-            return cmp(l._idx, r._idx)
-        done = []
-        errors = []
-        for idx, req in enumerate(self._incomplete):
-            if req._follows is None:
-                req._follows = follow
-            if req._retries is None:
-                req._retries = retries
-            req._idx = idx
-            req._accum = None
+        """Process all added requests until they are complete or timeout is reached (if supplied).
+                Requests still in flight when the timeout is reached are closed and left incomplete."""
+        deadline = None
+        if timeout is not None:
+            deadline = time.time() + timeout
+        self._nextCheck = time.time() + self.tick
+        self._schedule()                # anything left queued by an earlier run's timeout
+        while self._map or self._delayed or self._hits:
+            if not self._poll(deadline):
+                self._abort()
+                break
+        self._pool.prune()
+        return self._good, self._bad, self._incomplete.values()
+
+    def asCompleted(self, retries=5, follow=10, timeout=None):
+        """Run all added requests like execute(), but yield each one as soon as it is done (its
+                follows and any retries included), in whatever order they finish. The first request
+                to fail for good raises AWSCompoundError, abandoning the rest."""
+        deadline = None
+        if timeout is not None:
+            deadline = time.time() + timeout
+        pending = 0
+        for req in self._incomplete.values():
+            if not req._settle:
+                self._prepare(req, retries, follow)
+                pending += 1
+        return self._drive(pending, iter(()), retries, follow, None, deadline, False)
+
+    def imap(self, method, iterable, retries=5, follow=10, window=None):
+        """Call method (e.g. sdb.PutAttributes) with each tuple of arguments from iterable, execute
+                the requests it returns and yield their results in the same order. Arguments are
+                only taken from iterable as there is room for more requests: no more than window
+                (by default twice maxInFlight) are outstanding or waiting their turn to be yielded,
+                so an iterable of any length runs in constant memory. A request that fails for
+                good raises AWSCompoundError."""
+        for req in self._drive(0, itertools.starmap(method, iterable), retries, follow, window, None, True):
+            yield req.result
+
+    def imapUnordered(self, method, iterable, retries=5, follow=10, window=None):
+        """Like imap(), but yield results as the requests finish"""
+        for req in self._drive(0, itertools.starmap(method, iterable), retries, follow, window, None, False):
+            yield req.result
+
+    def map(self, method, iterable, retries=5, follow=10, window=None):
+        """Like imap(), but return a list of all of the results"""
+        return list(self.imap(method, iterable, retries, follow, window))
+
+    def _drive(self, pending, requests, retries, follow, window, deadline, ordered):
+        # Run the loop until the pending requests already added, and those taken from requests,
+        # are settled, yielding each (in the order requests produced them if ordered). Requests
+        # are only taken while fewer than window are outstanding.
+        if window is None:
+            window = 2 * self.maxInFlight if self.maxInFlight is not None else 256
+        self._done = collections.deque()
+        self._errors = []
+        self._nextCheck = time.time() + self.tick
+        ready = {}                      # requests settled out of order, by _idx
+        taken = 0
+        nextIdx = 0
         while True:
-            g, b, i = self.run()
-            tofollow = []
-            if follow:
-                for req in g:
-                    if req.follow(req):
-                        req._follows -= 1
-                        if req._follows < 0:
-                            errors.append(aws.AWSError(-1, 'follows exceeded', req))
-                            raise aws.AWSCompoundError(errors)
-                        tofollow.append(req)
-                    else:
-                        req.result = req._accum
-                        done.append(req)
-            else:
-                done.extend(g)
-            if len(b) == 0 and len(i) == 0 and len(tofollow) == 0:
-                done.sort(cmp=byIndex)
-                return done
-            self.clear()
-            for req in tofollow:
-                self.add(req)
-            for req in b + i:
+            while requests is not None and pending < window:
+                try:
+                    req = requests.next()
+                except StopIteration:
+                    requests = None
+                    break
+                self._prepare(req, retries, follow)
+                req._idx = taken
+                taken += 1
+                pending += 1
                 self.add(req)
-                errors.append(req.result)
-                req._retries -= 1
-                if req._retries < 0:
-                    raise aws.AWSCompoundError(errors)
+            while self._done:
+                req = self._done.popleft()
+                req._settle = False
+                if req._failed:
+                    self._fail()
+                if not ordered:
+                    pending -= 1
+                    yield req
+                    continue
+                ready[req._idx] = req
+                while nextIdx in ready:
+                    pending -= 1
+                    nextIdx += 1
+                    yield ready.pop(nextIdx - 1)
+            if pending <= 0 and requests is None:
+                break
+            if not self._poll(deadline):
+                self._errors.extend([aws.AWSError(-1, 'deadline exceeded', req) for req in self._incomplete.itervalues()])
+                self._fail()
+        self._pool.prune()
+
+    def _fail(self):
+        errors = self._errors
+        self._abort()
+        for req in self._incomplete.itervalues():
+            req._settle = False
+        self.clear()
+        raise aws.AWSCompoundError(errors)
+
+    def execute(self, retries=5, follow=10, timeout=None, ordered=True):
+        """Run all added requests to completion, retrying failures and following (e.g. NextToken)
+                chains, and return them in the order they were added, or in the order they finished
+                if ordered is False. If timeout is supplied it is a deadline for the whole batch,
+                including retries and follows."""
+        done = list(self.asCompleted(retries, follow, timeout))
+        if ordered:
+            done.sort(key=lambda req: req._idx)
+        return done
+
+    def profile(self, path=None, interval=0.001):
+        """Return a profiling.Profiler, to run a batch under in a with statement and report where its
+                CPU time went (signing, headers, I/O, handlers, followers). If path is given cProfile
+                runs too, and its stats are saved there."""
+        return profiling.Profiler(path, interval)
+
+
+def _checkPlain(request):
+    # AWSConnection only speaks plain HTTP, and sending it to an HTTPS port would only fail after
+    # timing out (and being retried)
+    if request.secure:
+        raise ValueError('%s needs HTTPS, which AWSRequestManager does not support; use aio.AsyncioTransport' % request._host)
 
 
 def ListFollow(req):
@@ -149,11 +846,391 @@ def ListFollow(req):
         return True
 
 
-class AWSRequest(asyncore.dispatcher_with_send):
+class _RecordBuilder(ET.TreeBuilder):
 
-    def __init__(self, host, uri, key, secret, action, parameters, handler=None, follower=None, verb='GET'):
-        asyncore.dispatcher_with_send.__init__(self)
+    def __init__(self, callbacks):
+        ET.TreeBuilder.__init__(self)
+        self._callbacks = callbacks
+
+    def end(self, tag):
+        elem = ET.TreeBuilder.end(self, tag)
+        callback = self._callbacks.get(tag)
+        if callback is not None:
+            callback(elem)
+            if self._elem:
+                del self._elem[-1][-1]          # drop it from its parent, it has been dealt with
+        return elem
+
+
+class XMLStream(object):
+    """Parses a response body incrementally, as AWSRequest receives it. callbacks maps element tags
+            to functions that are called with each such element as soon as its end tag is parsed,
+            after which the element is discarded, so memory use doesn't grow with the response.
+            close() returns result(), which should return whatever the callbacks collected.
+            """
+
+    def __init__(self, callbacks, result):
+        self._parser = ET.XMLParser(target=_RecordBuilder(callbacks))
+        self._result = result
+
+    def feed(self, data):
+        self._parser.feed(data)
+
+    def close(self):
+        self._parser.close()
+        return self._result()
 
+
+class AWSResponse(object):
+    """The status, headers and body of the response to one attempt at an AWSRequest. It exists only
+            while that attempt is in flight; finish() hands the body to the request's handler (or
+            closes its XMLStream) and returns the result."""
+    __slots__ = ('request', 'status', 'reason', 'headers', 'keepalive', 'body', 'xml', 'size')
+
+    def __init__(self, request):
+        self.request = request
+        self.status = None
+        self.reason = None
+        self.headers = None
+        self.keepalive = False
+        self.body = bytearray()         # preallocated by AWSConnection when Content-Length is known
+        self.xml = None
+        self.size = 0                   # bytes of body received
+
+    def getHeader(self, name, default=None):
+        return self.headers.get(name.lower(), default)
+
+    def parseHeaders(self, header):
+        """Parse the status line and headers"""
+        lines = header.split('\r\n')
+        version, status, reason = (lines[0].split(' ', 2) + [''])[:3]
+        self.status, self.reason = int(status), reason.strip()
+        self.headers = headers = {}
+        name = None
+        for line in lines[1:]:
+            if line[:1] in (' ', '\t') and name is not None:
+                headers[name] += ' ' + line.strip()     # continuation
+            else:
+                name, _, value = line.partition(':')
+                name = name.strip().lower()
+                headers[name] = value.strip()
+        connection = headers.get('connection', '').lower()
+        if version == 'HTTP/1.1':
+            self.keepalive = connection != 'close'
+        else:
+            self.keepalive = connection == 'keep-alive'
+        if self.request.stream is not None and self.status == 200:
+            self.xml = self.request.stream()
+
+    def feed(self, data):
+        if self.xml is not None:
+            self.size += len(data)
+            self.xml.feed(data)
+        else:
+            self.body += data
+
+    def finish(self):
+        if self.xml is not None:
+            return self.xml.close()
+        self.size = len(self.body)
+        return self.request.handle(self.status, self.reason, str(self.body))
+
+
+class AWSConnection(asyncore.dispatcher_with_send):
+    """Carries one attempt at an AWSRequest over a socket for AWSRequestManager: connects (or takes
+            a pooled socket), sends the request, reads the response as framed by Content-Length or
+            chunked encoding, and reports back with manager.reqComplete. It is created when the
+            request starts and dropped once it completes.
+            """
+
+    def __init__(self, request, manager, _map):
+        asyncore.dispatcher_with_send.__init__(self, map=_map)
+        self._request = request
+        self._manager = manager
+        self._lookup = None
+        self._body = None               # iterator over the rest of the request body
+        self._uses = 0
+        self._lastIO = time.time()
+
+    def start(self):
+        request = self._request
+        self._resetResponse()
+        sock, self._uses = self._manager._pool.acquire(request._host)
+        if sock is not None:
+            if request._timing is not None:
+                request._timing.reused = True
+            self.set_socket(sock)
+            self.connected = True
+            self.sendRequest()
+        else:
+            self._connect()
+
+    def _connect(self):
+        self._uses = 0
+        if self._request._timing is not None:
+            self._request._timing.reused = False
+        self._lastIO = time.time()
+        host, port = self._request.getAddress()
+        lookup = self._lookup = object()
+        def resolved(address, error):
+            if self._lookup is lookup:          # otherwise we timed out or were aborted meanwhile
+                self._resolved(address, error)
+        self._manager._resolver.resolve(host, port, resolved, self._map)
+
+    def _resolved(self, address, error):
+        self._lookup = None
+        if self._request._timing is not None:
+            self._request._timing.resolved = time.time()
+        if error is None:
+            try:
+                self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+                self.connect(address)
+                return
+            except socket.error, error:
+                self.close()
+        self._manager.reqComplete(self._request, False, error)
+
+    def _resetResponse(self):
+        self.out_buffer = ''
+        self._response = self._request.newResponse()
+        self._rxlen = None              # bytes of a preallocated body received so far
+        self._rxbuf = bytearray()       # received data not yet parsed
+        self._remaining = None
+        self._chunked = None
+
+    def close(self):
+        self._lookup = None
+        self._body = None
+        if self.socket is not None:
+            asyncore.dispatcher_with_send.close(self)
+
+    def handle_connect(self):
+        if self._request._timing is not None:
+            self._request._timing.connected = time.time()
+        self.sendRequest()
+
+    def sendRequest(self):
+        request = self._request
+        head = request.makeRequestHead()
+        self.send(head)
+        self._body = request.iterBody()
+        self._fillBody()
+        self._checkSent()
+
+        if DEBUG:
+            print head
+
+    def _fillBody(self):
+        # keep some of the body queued to send, without reading it all in at once
+        while self._body is not None and len(self.out_buffer) < 65536:
+            try:
+                data = self._body.next()
+            except StopIteration:
+                self._body = None
+                break
+            self.send(data)
+
+    def _checkSent(self):
+        # note when the whole request has been handed to the socket
+        timing = self._request._timing
+        if timing is not None and timing.sent is None and not self.out_buffer and self._body is None:
+            timing.sent = time.time()
+
+    def writable(self):
+        return asyncore.dispatcher_with_send.writable(self) or self._body is not None
+
+    def handle_expt(self):
+        self.close()
+        self._manager.reqComplete(self._request, False, 'connect')
+
+    def handle_error(self):
+        _, t, v, tbinfo = compact_traceback()
+        print 'channel error', str(v)
+        self.close()
+        self._manager.reqComplete(self._request, False, v)#'exception %s:%s %s' % (t, v, tbinfo))
+
+    def handle_write(self):
+        self._lastIO = time.time()
+        asyncore.dispatcher_with_send.handle_write(self)
+        if self._body is not None:
+            self._fillBody()
+        self._checkSent()
+
+    def handle_read(self):
+        self._lastIO = time.time()
+        timing = self._request._timing
+        if timing is not None and timing.firstByte is None:
+            timing.firstByte = self._lastIO
+        try:
+            if self._rxlen is not None:
+                # the rest of a body of known length goes straight into its buffer
+                size = self._recvInto(memoryview(self._response.body)[self._rxlen:], min(self._remaining, self._request.maxRead))
+                self._rxlen += size
+                self._remaining -= size
+                if self._remaining == 0:
+                    self._complete()
+                return
+            if self._response.status is None:
+                size = 8192
+            elif self._chunked and self._remaining > 0:
+                size = min(max(self._remaining + 2, 8192), self._request.maxRead)
+            else:
+                size = self._request.maxRead
+            data = self.recv(size)
+            if len(data) > 0:
+                self._rxbuf += data
+                self.parseResponse()
+        except ValueError, e:
+            self.close()
+            self._manager.reqComplete(self._request, False, e)
+
+    def _recvInto(self, buf, size):
+        # like asyncore.dispatcher.recv, but into buf
+        try:
+            size = self.socket.recv_into(buf, size)
+        except socket.error, why:
+            if why.args[0] in (errno.EWOULDBLOCK, errno.EAGAIN):
+                return 0
+            if why.args[0] not in _DISCONNECTED:
+                raise
+            size = 0
+        if size == 0:
+            self.handle_close()
+        return size
+
+    def parseResponse(self):
+        """Consume as much of the received data as possible, completing the request once the
+                response body (as framed by Content-Length or chunked encoding) has been read."""
+        request = self._request
+        response = self._response
+        if response.status is None:
+            end = self._rxbuf.find('\r\n\r\n')
+            if end < 0:
+                return
+            response.parseHeaders(str(self._rxbuf[:end]))
+            del self._rxbuf[:end + 4]
+            length = response.headers.get('content-length')
+            if request._verb == 'HEAD' or response.status in (204, 304):
+                self._remaining = 0
+            elif 'chunked' in response.headers.get('transfer-encoding', '').lower():
+                self._chunked = True
+            elif length is not None:
+                self._remaining = int(length)
+                if not request.streamBody and response.xml is None:
+                    response.body = bytearray(self._remaining)
+                    self._rxlen = 0
+            else:
+                response.keepalive = False      # body is delimited by the server closing
+        if self._chunked:
+            self._parseChunks()
+        elif self._remaining is None:
+            if self._rxbuf:
+                request.handle_body(str(self._rxbuf))
+                self._rxbuf = bytearray()
+        else:
+            if self._rxbuf:
+                data = self._rxbuf[:self._remaining]
+                del self._rxbuf[:len(data)]
+                self._remaining -= len(data)
+                if self._rxlen is not None:
+                    response.body[:len(data)] = data
+                    self._rxlen = len(data)
+                else:
+                    request.handle_body(str(data))
+            if self._remaining == 0:
+                self._complete()
+
+    def _parseChunks(self):
+        # self._remaining is None while waiting for a chunk size line, the number of bytes left
+        # in the current chunk, -1 while waiting for the CRLF after a chunk, or 0 after the last chunk.
+        rxbuf = self._rxbuf
+        while True:
+            if self._remaining is None:
+                end = rxbuf.find('\r\n')
+                if end < 0:
+                    return
+                size = int(str(rxbuf[:end]).split(';', 1)[0], 16)
+                del rxbuf[:end + 2]
+                self._remaining = size
+            elif self._remaining > 0:
+                if not rxbuf:
+                    return
+                data = rxbuf[:self._remaining]
+                del rxbuf[:len(data)]
+                self._remaining -= len(data)
+                self._request.handle_body(str(data))
+                if self._remaining == 0:
+                    self._remaining = -1
+            elif self._remaining < 0:
+                if len(rxbuf) < 2:
+                    return
+                del rxbuf[:2]
+                self._remaining = None
+            else:
+                end = rxbuf.find('\r\n')
+                if end < 0:
+                    return
+                del rxbuf[:end + 2]
+                if end == 0:            # blank line ends the trailers
+                    self._complete()
+                    return
+
+    def _complete(self):
+        timing = self._request._timing
+        if timing is not None:
+            timing.lastByte = time.time()
+            timing.status = self._response.status
+        if self._response.keepalive and not self._rxbuf and not self.out_buffer and self._body is None:
+            self._release()             # only once all of the request was sent: a server may answer early
+        else:
+            self.close()
+        response = self._response
+        try:
+            result = self._request.finishResponse()
+        except Exception, e:
+            success, result = False, e
+        else:
+            success = True
+        if timing is not None:
+            timing.handled = time.time()
+            timing.size = response.size
+        self._manager.reqComplete(self._request, success, result)
+
+    def _release(self):
+        # hand the still open socket back to the pool for the next request to this host
+        self.del_channel()
+        sock, self.socket = self.socket, None
+        self.connected = False
+        self._manager._pool.release(self._request._host, sock, self._uses + 1)
+
+    def handle_close(self):
+        if self.socket is None:
+            return
+        if self._response.status is not None and self._remaining is None and not self._chunked:
+            self._complete()
+        elif self._uses and self._response.status is None and not self._rxbuf:
+            # a pooled connection was closed by the server before it answered, try a fresh one
+            self.close()
+            self._resetResponse()
+            self._connect()
+        else:
+            self.close()
+            self._manager.reqComplete(self._request, False, 'connection closed')
+
+
+class AWSRequest(object):
+    """Describes a call to an AWS service: where it goes, its parameters, and what to do with the
+            response. It holds no socket; AWSRequestManager gives it an AWSConnection only while it
+            is in flight, so queued requests stay small.
+            """
+    __slots__ = ('_host', '_uri', '_key', '_secret', '_parameters', '_verb', '_action', '_handler', '_follower',
+                    'stream', 'streamBody', 'connectTimeout', 'readTimeout', 'result', '_accum', '_conn', '_response',
+                    '_follows', '_retries', '_settle', '_future', '_started', '_following', '_attempt', '_idx',
+                    '_failed', '_errors', '_paced', '_startedAt', '_hedge', '_hedgeOf', '_identity', '_riders', '_size', '_timing')
+    maxRead = 65536             # largest single recv of a response body
+    secure = False              # True for endpoints that need HTTPS: only aio.AsyncioTransport can send them
+
+    def __init__(self, host, uri, key, secret, action, parameters, handler=None, follower=None, verb='GET'):
         self._host = host
         self._uri = uri
         self._key = key
@@ -164,15 +1241,62 @@ class AWSRequest(asyncore.dispatcher_with_send):
             if value is not None:
                 self._parameters[key] = str(value)
         self._action = action
-        if handler is not None:
-            self.handle = handler
-        if follower is not None:
-            self.follow = follower
+        self._handler = handler
+        self._follower = follower
+        self.stream = None              # function returning an XMLStream to parse a 200 response with, instead of handle
+        self.streamBody = False         # True if handle_body consumes the body, rather than it being buffered for handle
+        self.connectTimeout = None
+        self.readTimeout = None
+        self.result = None
+        self._accum = None
+        self._conn = None
+        self._response = None
         self._follows = None
         self._retries = None
+        self._settle = False
+        self._future = None
+        self._started = False
+        self._paced = False
+        self._hedge = None
+        self._hedgeOf = None
+        self._identity = None
+        self._riders = None
+        self._size = None               # bytes in the response just received, for the cache
+        self._timing = None             # timing.Timing of the current attempt, if the manager has observers
 
     def copy(self):
-        return AWSRequest(self._host, self._uri, self._key, self._secret, self._action, self._parameters, self.handle)
+        return AWSRequest(self._host, self._uri, self._key, self._secret, self._action, self._parameters, self._handler)
+
+    def duplicate(self):
+        """Return an exact copy of this request, to send alongside it"""
+        dup = copy.copy(self)
+        dup._parameters = dict(self._parameters)
+        dup.result = None
+        dup._conn = None
+        dup._response = None
+        dup._settle = False
+        dup._future = None
+        dup._started = False
+        dup._paced = False
+        dup._hedge = None
+        dup._hedgeOf = None
+        dup._identity = None
+        dup._riders = None
+        dup._size = None
+        dup._timing = None
+        return dup
+
+    def idempotent(self):
+        """True if sending this request more than once does no harm (a GET of a read Action)"""
+        return self._verb == 'GET' and self._action is not None and self._action.startswith(READ_PREFIXES)
+
+    def identity(self):
+        """What this request asks for, regardless of when it is signed: two requests with the same
+                identity get the same response, handled by the same code"""
+        parameters = self._parameters
+        return (self._host, self._verb, self._uri, self._key, self._action,
+                        tuple(sorted([item for item in parameters.iteritems() if item[0] not in _SIGNING])),
+                        getattr(self._handler, 'func_code', self._handler), getattr(self.stream, 'func_code', self.stream))
 
     def addParm(self, name, value):
         if value is not None:
@@ -189,10 +1313,14 @@ class AWSRequest(asyncore.dispatcher_with_send):
         self.addParm(name, value)
 
     def handle(self, status, reason, data):
+        if self._handler is not None:
+            return self._handler(status, reason, data)
         print 'Default Handler: %r %r %r' % (status, reason, data)
         return data
 
     def follow(self, request, *args):
+        if self._follower is not None:
+            return self._follower(request, *args)
         # Default follow handler does not follow (We can't assume a NextToken)
         request._accum = request.result
 
@@ -204,30 +1332,43 @@ class AWSRequest(asyncore.dispatcher_with_send):
         return resp.status, resp.reason, resp.read()
 
     def _execute(self, verb, retries=5, follow=10):
+        # Blocking, but retried and followed as by AWSRequestManager.execute
+        cache = responseCache
         nFollow = follow
-        current = self
-        accumulator = None
+        self._accum = None
         while True:
             try:
-                status, reason, data = self._attemptReq(current, verb)
-                result = self.handle(status, reason, data)
-                if follow:
-                    current, accumulator = self.follow(current, result, accumulator)
-                    if current is None:
-                        return accumulator
-                    if --nFollow <= 0:
-                        raise aws.AWSError(-1, 'Number of follows exceeded', data)
-                else:
-                    return result
+                result = None
+                if cache is not None:
+                    result = cache.lookup(self)
+                if result is None:
+                    status, reason, data = self._attemptReq(self, verb)
+                    if cache is not None:
+                        cache.invalidate(self)
+                    result = self.handle(status, reason, data)
+                    if cache is not None:
+                        cache.store(self, result, len(data))
             except aws.AWSError:
                 if retries <= 0:
                     raise           # out of retries
                 retries -= 1
+                continue
+            self.result = result
+            if not follow:
+                return result
+            if not self.follow(self):
+                return self._accum
+            nFollow -= 1
+            if nFollow < 0:
+                raise aws.AWSError(-1, 'Number of follows exceeded', self)
 
-    def execute(self, retries=5, follow=10):
+    def execute(self, retries=5, follow=10, timeout=None):
         mgr = AWSRequestManager()
-        mgr.add(self)
-        return mgr.execute(retries, follow)[0].result
+        try:
+            mgr.add(self)
+            return mgr.execute(retries, follow, timeout)[0].result
+        finally:
+            mgr.close()
 
     def GET(self, retries=5, follow=10):
         # XXX: deprecated
@@ -235,78 +1376,58 @@ class AWSRequest(asyncore.dispatcher_with_send):
 
     # Async methods
     def ExecAsync(self, manager, _map):
-        self._map = _map
-        self._manager = manager
-        self._rx = []
-        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.connect((self._host, 80))
+        self._conn = manager.connectionFactory(self, manager, _map)
+        self._conn.start()
 
-    def handle_connect(self):
-        request = '%s %s HTTP/1.0\r\n' % (self._verb, self.makePath())
+    def newResponse(self):
+        """Start receiving a response to this request"""
+        self._response = AWSResponse(self)
+        return self._response
+
+    def getAddress(self):
+        host, _, port = self._host.partition(':')
+        return host, int(port or (443 if self.secure else 80))
+
+    def makeRequestHead(self):
+        """Return the request line and headers"""
+        request = '%s %s HTTP/1.1\r\n' % (self._verb, self.makePath())
         headers = ['Host: %s' % self._host]
         if self._verb in ('PUT', 'POST'):
             headers.append('Content-Length: %d' % self.getContentLength())
         extra = self.makeHeaders(self._verb)
         if extra is not None:
             headers.extend(['%s: %s' % (key, value) for key, value in extra.items()])
-        self.send(request + '\r\n'.join(headers) + '\r\n\r\n')
-        body = self.makeBody()
-        if body:
-            self.send(body)
+        return request + '\r\n'.join(headers) + '\r\n\r\n'
 
-        if DEBUG:
-            print request, headers, body
-
-    def handle_expt(self):
-        self._manager.reqComplete(self, False, 'connect')
-        self.close()
-
-    def handle_error(self):
-        _, t, v, tbinfo = compact_traceback()
-        print 'channel error', str(v)
-        self._manager.reqComplete(self, False, v)#'exception %s:%s %s' % (t, v, tbinfo))
-        self.close()
+    def handle_body(self, data):
+        """Called with each piece of the response body as it is received, unless it is being read
+                straight into a buffer of its Content-Length (see streamBody)."""
+        self._response.feed(data)
 
-    def handle_read(self):
-        data = self.recv(2048)
-        if len(data) > 0:
-            self._rx.append(data)
+    def getHeader(self, name, default=None):
+        """Return a header of the response being received"""
+        return self._response.getHeader(name, default)
 
-    def handle_close(self):
-        try:
-            data = ''.join(self._rx)
-            header, data = data.split('\r\n\r\n', 1)
-            fp = StringIO.StringIO(header)
-            _, status, reason = fp.readline().split(' ', 2)
-            header = mimetools.Message(fp)
-            result = self.handle(int(status), reason, data)
-            self._manager.reqComplete(self, True, result)
-        except ValueError, e:
-            self._manager.reqComplete(self, False, e)
-        self.close()
+    def finishResponse(self):
+        """Return the result of the response that has been received (or raise the handler's error)"""
+        response, self._response = self._response, None
+        result = response.finish()
+        self._size = response.size
+        return result
 
     def makeURL(self):
         return 'http://' + self._host + self.makePath()
 
     def makePath(self, verb='GET'):
+        signer = getSigner(self._key, self._secret)
         parameters = self._parameters
         parameters['Action'] = self._action
         parameters['AWSAccessKeyId'] = self._key
         parameters['SignatureMethod'] = 'HmacSHA256'
         parameters['SignatureVersion'] = '2'
         if 'Timestamp' not in parameters:
-            parameters['Timestamp'] = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
-        parms = []
-        for key in sorted(parameters.keys()):
-            parms.append(urllib.quote(key, safe='') + '=' + urllib.quote(parameters[key], safe='-_~'))
-#                       parms.append('%s=%s' % (key, urllib.quote(parameters[key])))
-        tosign = '%s\n%s\n%s\n%s' % ('GET', self._host, urllib.quote(self._uri), '&'.join(parms))
-        h = hmac.new(self._secret, tosign, digestmod=hashlib.sha256)
-#               print '%r' % tosign
-        digest = base64.b64encode(h.digest())
-#               print 'base64 digest %r (%s)' % (digest, h.hexdigest())
-        parms.append('Signature=' + urllib.quote(digest, safe='-_~'))
-        return urllib.quote(self._uri) + '?' + '&'.join(parms)
+            parameters['Timestamp'] = signer.timestamp()
+        return signer.signPath(self._host, urllib.quote(self._uri), parameters)
 
     def makeHeaders(self, verb='GET'):
         return {}
@@ -317,6 +1438,12 @@ class AWSRequest(asyncore.dispatcher_with_send):
     def getContentLength(self):
         return len(self.makeBody())
 
+    def iterBody(self):
+        """Yield the request body in pieces"""
+        body = self.makeBody()
+        if body:
+            yield body
+
 
 if __name__ == '__main__':
     key, secret = aws.getBotoCredentials()
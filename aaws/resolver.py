@@ -0,0 +1,166 @@
+#
+# Copyright 2011 Snitch Incorporated
+#
+# This file is part of AAWS.
+#
+# AAWS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# AAWS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with AAWS.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#               resolver.py,
+#
+#                       This module looks up AWS endpoint addresses without blocking the asyncore loop.
+#                       getaddrinfo runs on worker threads, and the results are handed back to the loop
+#                       through a pipe, so the callbacks always run on the loop's thread.
+#                       Addresses are cached per (host, port) so a batch of requests to one endpoint
+#                       costs a single lookup. One resolver may serve several managers, on any threads:
+#                       each manager's callbacks are run on its own loop.
+#
+#
+
+import threading
+import Queue
+import socket
+import time
+import eventloop
+
+
+class Resolver(object):
+    """Resolves host names on a few worker threads and caches the addresses.
+
+            ttl -- seconds a resolved address is reused before it is looked up again.
+            threads -- number of worker threads doing lookups.
+            """
+
+    def __init__(self, ttl=60.0, threads=2):
+        self.ttl = ttl
+        self.threads = threads
+        self._cache = {}                # (host, port) -> (expires, address)
+        self._waiting = {}              # (host, port) -> [(callback, _map)] waiting on the lookup
+        self._loops = {}                # id(_map) -> _Loop, for each map with lookups under way
+        self._todo = Queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()   # managers on several threads may share the resolver
+
+    def resolve(self, host, port, callback, _map):
+        """Call callback(address, error) on the loop's thread once host is resolved. address is a
+                (ip, port) tuple to connect to, or None if the lookup failed with error. Cached and
+                numeric hosts are answered before resolve returns, otherwise _map is kept busy until
+                the lookup finishes.
+                """
+        key = (host, port)
+        if self._isNumeric(host):
+            callback(key, None)
+            return
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] <= time.time():
+                del self._cache[key]
+                entry = None
+            if entry is None:
+                loop = self._loops.get(id(_map))
+                if loop is None or loop.map is not _map:
+                    loop = self._loops[id(_map)] = _Loop(self, _map)
+                loop.pending += 1
+                loop.waker.attach(_map)
+                waiting = self._waiting.get(key)
+                if waiting is None:
+                    waiting = self._waiting[key] = []
+                    while len(self._workers) < self.threads:
+                        worker = threading.Thread(target=self._work, name='aaws-resolver')
+                        worker.daemon = True
+                        worker.start()
+                        self._workers.append(worker)
+                    self._todo.put(key)
+                waiting.append((callback, _map))
+                return
+        callback(entry[1], None)
+
+    def deliver(self, _map):
+        """Run the callbacks for _map's finished lookups"""
+        with self._lock:
+            loop = self._loops.get(id(_map))
+            if loop is None or loop.map is not _map:
+                return
+            ready, loop.ready = loop.ready, []
+            loop.pending -= len(ready)
+            if not loop.pending:
+                loop.waker.detach()
+        for callback, address, error in ready:
+            callback(address, error)
+
+    def forget(self, _map):
+        """Drop _map's lookups and close its waker, once the loop is done with the map"""
+        with self._lock:
+            loop = self._loops.get(id(_map))
+            if loop is not None and loop.map is _map:
+                del self._loops[id(_map)]
+                loop.waker.close()
+
+    def flush(self):
+        """Forget every cached address"""
+        self._cache = {}
+
+    def close(self):
+        """Stop the worker threads and close the wakers' pipes. Lookups still waiting are dropped
+                without their callbacks being called. The resolver starts afresh if used again."""
+        with self._lock:
+            for worker in self._workers:
+                self._todo.put(None)
+            self._workers = []
+            for loop in self._loops.values():
+                loop.waker.close()
+            self._loops = {}
+            self._waiting = {}
+
+    def _isNumeric(self, host):
+        try:
+            socket.inet_pton(socket.AF_INET, host)
+        except (socket.error, ValueError):
+            return False
+        return True
+
+    def _work(self):
+        while True:
+            key = self._todo.get()
+            if key is None:
+                return                  # close()
+            host, port = key
+            try:
+                address = socket.getaddrinfo(host, port, socket.AF_INET, socket.SOCK_STREAM)[0][4]
+                error = None
+            except socket.error, e:
+                address, error = None, e
+            with self._lock:
+                if address is not None:
+                    self._cache[key] = (time.time() + self.ttl, address)
+                woken = set()
+                for callback, _map in self._waiting.pop(key, []):
+                    loop = self._loops.get(id(_map))
+                    if loop is None or loop.map is not _map:
+                        continue        # forgotten
+                    loop.ready.append((callback, address, error))
+                    if loop not in woken:
+                        woken.add(loop)
+                        loop.waker.wake()
+
+
+class _Loop(object):
+    # The lookups of one map, and the waker that runs their callbacks on its loop's thread
+    __slots__ = ('map', 'waker', 'pending', 'ready')
+
+    def __init__(self, resolver, _map):
+        self.map = _map
+        self.waker = eventloop.Waker(lambda: resolver.deliver(_map))
+        self.pending = 0                # callbacks waiting on a lookup or to be run
+        self.ready = []                 # (callback, address, error) to run
@@ -33,6 +33,8 @@ import httplib
 
 
 class Route53Request(request.AWSRequest):
+    __slots__ = ('_version', '_body', '_contentType')
+    secure = True
 
     def __init__(self, host, version, uri, key, secret, parameters, handler=None, follower=None, verb='GET', body=None, contentType=None):
         self._version = version
@@ -63,6 +65,9 @@ class Route53Request(request.AWSRequest):
             return {'Date': timestamp, 'X-Amzn-Authorization': auth, 'Content-Type': self._contentType}
         return {'Date': timestamp, 'X-Amzn-Authorization': auth}
 
+    def makeBody(self):
+        return self._body or ''
+
     def execute(self):
         conn = httplib.HTTPSConnection(self._host)
         conn.request(self._verb, self.makePath(self._verb), self._body, self.makeHeaders(self._verb))
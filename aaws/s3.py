@@ -36,11 +36,10 @@ import hashlib
 import base64
 import urllib
 import os
-import StringIO
-import mimetools
 
 
 class S3Request(request.AWSRequest):
+    __slots__ = ('_bucket', '_body', '_progress', '_sendfile', '_recvfile', '_cl', '_rxtot', '_tosend', '_contentType')
 
     def __init__(self, host, uri, key, secret, bucket, parameters, handler=None, follower=None, verb='GET', body='', contentType='text/plain', progresscb=None):
         self._bucket = bucket
@@ -56,11 +55,13 @@ class S3Request(request.AWSRequest):
                 self._body = ''
             else:
                 self._sendfile = self._body
+        self._tosend = None
         self._contentType = contentType
         request.AWSRequest.__init__(self, host, uri, key, secret, None, parameters, handler, follower, verb)
+        self.streamBody = self._recvfile is not None
 
     def copy(self):
-        return S3Request(self._host, self._uri, self._key, self._secret, self._bucket, self._parameters, self.handle, self.follow, self._verb)
+        return S3Request(self._host, self._uri, self._key, self._secret, self._bucket, self._parameters, self._handler, self._follower, self._verb)
 
     def makePath(self, verb='GET'):
         parms = []
@@ -115,52 +116,31 @@ class S3Request(request.AWSRequest):
         else:
             return base64.b64encode(hashlib.md5(self._body).digest())
 
-    def handle_write(self):
-        request.AWSRequest.handle_write(self)
-        remain = len(self.out_buffer)
-        # callback our Progress meter
-        if self._progress and self._verb != 'GET':
-            self._progress(self._buffered - remain, self._tosend)
-        if remain < 4096 and self._sendfile:
-            data = self._sendfile.read(4096)
-            if len(data) < 4096:
-                self._sendfile = None
-            self._buffered += len(data)
-            self.send(data)
-
-    def handle_connect(self):
-        request.AWSRequest.handle_connect(self)
-        # buffer up some file (call 'send' on it)
-        if self._sendfile:
-            data = self._sendfile.read(4096)
-            if len(data) < 4096:
-                self._sendfile = None
-            self._buffered = len(data)
-            self.send(data)
-
-    def handle_read(self):
+    def iterBody(self):
+        if not self._sendfile:
+            if self._body:
+                yield self._body
+            return
+        sent = 0
+        while True:
+            data = self._sendfile.read(65536)
+            if not data:
+                break
+            sent += len(data)
+            yield data
+            if self._progress:
+                self._progress(sent, self._tosend)
+
+    def handle_body(self, data):
         if self._recvfile:
-            data = self.recv(4096)
-            if len(data) > 0:
-                if self._cl:
-                    self._recvfile.write(data)
-                    self._rxtot += len(data)
-                    if self._progress:
-                        self._progress(self._rxtot, self._cl)
-                else:
-                    self._rx.append(data)
-                    data = ''.join(self._rx)
-                    header, data = data.split('\r\n\r\n', 1)
-                    fp = StringIO.StringIO(header)
-                    _, status, reason = fp.readline().split(' ', 2)
-                    header = mimetools.Message(fp)
-                    self._cl = int(header.get('Content-Length'))
-                    self._recvfile.write(data)
-                    if self._progress:
-                        self._progress(len(data), self._cl)
-                    self._rxtot = len(data)
+            if self._cl is None:
+                self._cl = int(self.getHeader('Content-Length', 0))
+            self._recvfile.write(data)
+            self._rxtot += len(data)
+            if self._progress:
+                self._progress(self._rxtot, self._cl)
         else:
-            request.AWSRequest.handle_read(self)
+            request.AWSRequest.handle_body(self, data)
 
 
 
@@ -230,8 +210,8 @@ class S3(AWSService):
         return S3Request(BucketName + '.' + self._endpoint, '/', self._key, self._secret, BucketName, {}, response, body=body, verb='PUT')
 
 
-    def ListObjects(self, BucketName, delimiter=None, marker=None, maxKeys=None, prefix=None, Progress=None):
-        """"""
+    def ListObjects(self, BucketName, delimiter=None, marker=None, maxKeys=None, prefix=None, Progress=None, Stream=False):
+        """Stream -- If True, parse the response as it is received rather than once it is complete."""
         def findadd(m, node, attr, dictattr=None):
             if dictattr is None:
                 dictattr = attr
@@ -239,6 +219,21 @@ class S3(AWSService):
             if node is not None:
                 m[dictattr] = node.text
 
+        def commonPrefixes(objects, node):
+            objects[node.find('{%s}Prefix' % self.xmlns).text] = None
+
+        def contents(objects, node):
+            obj = {}
+            key = node.find('{%s}Key' % self.xmlns).text
+            findadd(obj, node, 'LastModified')
+            findadd(obj, node, 'ETag')
+            findadd(obj, node, 'Size')
+            findadd(obj, node, 'StorageClass')
+            owner = node.find('{%s}Owner' % self.xmlns)
+            findadd(obj, owner, 'ID', 'Owner.ID')
+            findadd(obj, owner, 'DisplayName', 'Owner.DisplayName')
+            objects[key] = obj
+
         def response(status, reason, data):
             if status == 200:
 #                               print data
@@ -246,22 +241,21 @@ class S3(AWSService):
                 objects = {}
                 limited = root.find('.//{%s}IsTruncated' % self.xmlns).text == 'true'
                 for node in root.findall('.//{%s}CommonPrefixes' % self.xmlns):
-                    prefix = node.find('{%s}Prefix' % self.xmlns).text
-                    objects[prefix] = None
+                    commonPrefixes(objects, node)
                 for node in root.findall('.//{%s}Contents' % self.xmlns):
-                    obj = {}
-                    key = node.find('{%s}Key' % self.xmlns).text
-                    findadd(obj, node, 'LastModified')
-                    findadd(obj, node, 'ETag')
-                    findadd(obj, node, 'Size')
-                    findadd(obj, node, 'StorageClass')
-                    owner = node.find('{%s}Owner' % self.xmlns)
-                    findadd(obj, owner, 'ID', 'Owner.ID')
-                    findadd(obj, owner, 'DisplayName', 'Owner.DisplayName')
-                    objects[key] = obj
+                    contents(objects, node)
                 return objects, limited
             raise AWSError(status, reason, data)
 
+        def stream():
+            objects = {}
+            limited = []
+            return request.XMLStream({
+                            '{%s}CommonPrefixes' % self.xmlns: lambda node: commonPrefixes(objects, node),
+                            '{%s}Contents' % self.xmlns: lambda node: contents(objects, node),
+                            '{%s}IsTruncated' % self.xmlns: lambda node: limited.append(node.text == 'true'),
+                    }, lambda: (objects, limited == [True]))
+
         def follow(req):
             """This is a follower that expects a result in the form (list_of_things, NextToken).
                     If NextToken is not None then we return a copied request with the NextToken parameter set
@@ -279,11 +273,14 @@ class S3(AWSService):
             if Progress:
                 Progress(len(req._accum.keys()), True)
 
-        return S3Request(BucketName + '.' + self._endpoint, '/', self._key, self._secret, BucketName, {
+        r = S3Request(BucketName + '.' + self._endpoint, '/', self._key, self._secret, BucketName, {
                         'delimiter': delimiter,
                         'prefix': prefix,
                         'marker': marker,
                 }, response, follow)
+        if Stream:
+            r.stream = stream
+        return r
 
 
     def PutObject(self, BucketName, Key, Data, ContentType='text/plain', Progress=None):
@@ -424,7 +424,7 @@ class SimpleDB(AWSService):
         return r
 
 
-    def Select(self, SelectExpression, NextToken=None, ConsistentRead=None, boxusage=None):
+    def Select(self, SelectExpression, NextToken=None, ConsistentRead=None, boxusage=None, Stream=False):
         """The Select operation returns a set of Attributes for ItemNames that match the select expression. Select is
                 similar to the standard SQL SELECT statement.
 
@@ -454,36 +454,53 @@ class SimpleDB(AWSService):
                 SelectExpression -- The expression used to query the domain.
                 NextToken -- String that tells Amazon SimpleDB where to start the next list of ItemNames.
                 ConsistentRead -- When set to true, ensures that the most recent data is returned. For more information, see Consistency
+                Stream -- If True, parse the response as it is received rather than once it is complete.
 
                 returns a list of items which are tuples of (ItemName, Attributes) where Attributes is a list of (Name, Value) tuples.
                 """
 
+        def item(node):
+            name = node.find('{%s}Name' % self.xmlns).text
+            attribs = []
+            for attr in node.findall('{%s}Attribute' % self.xmlns):
+                attribs.append((attr.find('{%s}Name' % self.xmlns).text, attr.find('{%s}Value' % self.xmlns).text))
+            return name, attribs
+
         def response(status, reason, data):
             if status == 200:
 #                               print data
                 root = ET.fromstring(data)
                 if boxusage is not None:
                     boxusage.append(root.find('.//{%s}BoxUsage' % self.xmlns).text)
-                items = []
-                for node in root.findall('.//{%s}Item' % self.xmlns):
-                    name = node.find('{%s}Name' % self.xmlns).text
-                    attribs = []
-                    for attr in node.findall('{%s}Attribute' % self.xmlns):
-                        attribs.append((attr.find('{%s}Name' % self.xmlns).text, attr.find('{%s}Value' % self.xmlns).text))
-                    items.append((name, attribs))
+                items = [item(node) for node in root.findall('.//{%s}Item' % self.xmlns)]
                 token = None
-                node = root.find('.//{%s}NextToken')
+                node = root.find('.//{%s}NextToken' % self.xmlns)
                 if node is not None:
                     token = node.text
                 return items, token
             raise AWSError(status, reason, data)
 
-        return request.AWSRequest(self._endpoint, '/', self._key, self._secret, 'Select', {
+        def stream():
+            items = []
+            token = []
+            def box(node):
+                if boxusage is not None:
+                    boxusage.append(node.text)
+            return request.XMLStream({
+                            '{%s}Item' % self.xmlns: lambda node: items.append(item(node)),
+                            '{%s}NextToken' % self.xmlns: lambda node: token.append(node.text),
+                            '{%s}BoxUsage' % self.xmlns: box,
+                    }, lambda: (items, token[0] if token else None))
+
+        r = request.AWSRequest(self._endpoint, '/', self._key, self._secret, 'Select', {
                         'SelectExpression': SelectExpression,
                         'NextToken': NextToken,
                         'ConsistentRead': ConsistentRead,
                         'Version': self.version,
                 }, response, request.ListFollow)
+        if Stream:
+            r.stream = stream
+        return r
 
 
 
@@ -0,0 +1,113 @@
+#
+# Copyright 2011 Snitch Incorporated
+#
+# This file is part of AAWS.
+#
+# AAWS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# AAWS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with AAWS.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#               slowlog.py,
+#
+#                       This module keeps the most recent slow requests an AWSRequestManager made, with
+#                       enough about each (Action, sizes, status, retries, where the time went) to see
+#                       why, so that when Select or ListObjects calls start taking ten times longer the
+#                       culprits can be dumped without turning on DEBUG:
+#
+#                               slow = aaws.SlowLog(threshold=2.0)
+#                               slow.attach(manager)
+#                               ...
+#                               slow.dump()
+#
+#
+
+import collections
+import sys
+import time
+from request import _SIGNING
+
+
+class SlowLog(object):
+    """Ring buffer of the last size attempts at requests that took longer than threshold
+            seconds from starting to completing. thresholds may override threshold for some
+            Actions, e.g. {'Select': 5.0}.
+
+            Each entry is a dict of the request's action, host, verb and uri, the length of each
+            of its parameters (not their values), and the attempt's status, size (of the response
+            body), error, retry and follow counts, duration, when it completed and its phases (see
+            timing.Timing.phases).
+            """
+
+    def __init__(self, threshold=1.0, size=100, thresholds=None):
+        self.threshold = threshold
+        self.thresholds = dict(thresholds or {})
+        self._entries = collections.deque(maxlen=size)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def attach(self, manager):
+        """Record manager's slow requests"""
+        manager.observers.append(self.observe)
+
+    def detach(self, manager):
+        manager.observers.remove(self.observe)
+
+    def observe(self, request, timing):
+        """AWSRequestManager observer (see timing.Timing)"""
+        if timing.started is None:
+            return
+        duration = timing.completed - timing.started
+        if duration < self.thresholds.get(request._action, self.threshold):
+            return
+        error = timing.error
+        if error is not None:
+            error = str(error)
+        self._entries.append({
+            'action': request._action,
+            'host': request._host,
+            'verb': request._verb,
+            'uri': request._uri,
+            'parameters': dict([(name, len(value)) for name, value in request._parameters.items()
+                                    if name not in _SIGNING]),
+            'status': timing.status,
+            'size': timing.size,
+            'error': error,
+            'retry': timing.retry,
+            'follow': timing.follow,
+            'duration': duration,
+            'completed': timing.completed,
+            'phases': timing.phases(),
+        })
+
+    def entries(self):
+        """The recorded requests, oldest first"""
+        return list(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+
+    def dump(self, out=None):
+        """Write the recorded requests to out (by default stderr), one per line"""
+        if out is None:
+            out = sys.stderr
+        for entry in self.entries():
+            phases = ' '.join(['%s=%.3f' % (name, entry['phases'][name]) for name in
+                                    ('queue', 'resolve', 'connect', 'send', 'wait', 'receive', 'handle')
+                                    if name in entry['phases']])
+            parameters = sum(entry['parameters'].values())
+            out.write('%s %.3fs %s %s%s status=%s size=%s params=%d/%dB retry=%d follow=%d %s%s\n' % (
+                    time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(entry['completed'])), entry['duration'],
+                    entry['action'] or entry['verb'], entry['host'], entry['uri'], entry['status'], entry['size'],
+                    len(entry['parameters']), parameters, entry['retry'], entry['follow'], phases,
+                    entry['error'] and ' error=%r' % entry['error'] or ''))
@@ -178,7 +178,7 @@ class SQS(AWSService):
         return request.AWSRequest(self._endpoint, p.path, self._key, self._secret, 'SendMessageBatch', params, response)
 
 
-    def ReceiveMessage(self, queueUrl, AttributeNames=None, MaxNumberOfMessages=None, VisibilityTimeout=None):
+    def ReceiveMessage(self, queueUrl, AttributeNames=None, MaxNumberOfMessages=None, VisibilityTimeout=None, Stream=False):
         """The receiveMessage action retrieves one or more messages from the specified queue.
 
             AttributeNames -- A list of strings giving the attribute names you wish to receive. If not supplied then no attributes are returned.
@@ -191,6 +191,7 @@ class SQS(AWSService):
                     retrieved by a ReceiveMessage request.
                 Constraints: 0 to 43200 (maximum 12 hours)
                 Default: The visibility timeout for the queue
+            Stream -- If True, parse the response as it is received rather than once it is complete.
 
             Returns a list of dicts. Each dict contains the following keys (and any AttributeNames requested):
                 Body - The message body
@@ -199,28 +200,33 @@ class SQS(AWSService):
                 ReceiptHandle - required for calls to ChangeMessageVisibility + DeleteMessage
             """
 
+        def findadd(m, node, attr):
+            node = node.find('{%s}%s' % (self.xmlns, attr))
+            if node is not None:
+                m[attr] = node.text
+
+        def message(node):
+            m = {}
+            findadd(m, node, 'Body')
+            findadd(m, node, 'MD5OfBody')
+            findadd(m, node, 'MessageId')
+            findadd(m, node, 'ReceiptHandle')
+            for attrnode in node.findall('{%s}Attribute' % self.xmlns):
+                name = attrnode.find('{%s}Name' % self.xmlns).text
+                value = attrnode.find('{%s}Value' % self.xmlns).text
+                m[name] = value
+            return m
+
         def response(status, reason, data):
-            def findadd(m, node, attr):
-                node = node.find('{%s}%s' % (self.xmlns, attr))
-                if node is not None:
-                    m[attr] = node.text
             if status == 200:
                 root = ET.fromstring(data)
-                msgs = []
-                for node in root.findall('.//{%s}Message' % self.xmlns):
-                    m = {}
-                    findadd(m, node, 'Body')
-                    findadd(m, node, 'MD5OfBody')
-                    findadd(m, node, 'MessageId')
-                    findadd(m, node, 'ReceiptHandle')
-                    for attrnode in node.findall('{%s}Attribute' % self.xmlns):
-                        name = attrnode.find('{%s}Name' % self.xmlns).text
-                        value = attrnode.find('{%s}Value' % self.xmlns).text
-                        m[name] = value
-                    msgs.append(m)
-                return msgs
+                return [message(node) for node in root.findall('.//{%s}Message' % self.xmlns)]
             raise AWSError(status, reason, data)
 
+        def stream():
+            msgs = []
+            return request.XMLStream({'{%s}Message' % self.xmlns: lambda node: msgs.append(message(node))}, lambda: msgs)
+
         p = urlparse(queueUrl)
         r = request.AWSRequest(self._endpoint, p.path, self._key, self._secret, 'ReceiveMessage', {
             'Version': self.version,
@@ -230,6 +236,8 @@ class SQS(AWSService):
         if AttributeNames is not None:
             for idx, attr in enumerate(AttributeNames):
                 r.addParm('AttributeName.%d' % (idx + 1), attr)
+        if Stream:
+            r.stream = stream
         return r
 
 
@@ -0,0 +1,93 @@
+#
+# Copyright 2011 Snitch Incorporated
+#
+# This file is part of AAWS.
+#
+# AAWS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# AAWS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with AAWS.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#               timing.py,
+#
+#                       This module holds the Timing that AWSRequestManager records for each attempt at a
+#                       request when it has observers, so that a slow request can be put down to the
+#                       network (resolve, connect, send, receive), AWS (wait) or our own handlers (handle).
+#                       For example, to print every attempt's phases:
+#
+#                               def observe(request, timing):
+#                                   print request._action, timing.status, timing.phases()
+#                               manager.observers.append(observe)
+#
+#
+
+
+class Timing(object):
+    """When one attempt at a request went through each phase, as time.time() values. A phase it
+            didn't go through is None: a request answered by the cache or by an identical request
+            in flight is never started, and one sent on a pooled connection is neither resolved nor
+            connected (reused is True).
+
+            queued -- added to its host's queue, or for a hedge, started.
+            started, resolved, connected -- a connection taken from the pool or opened for it.
+            sent -- the last of the request handed to the socket.
+            firstByte, lastByte -- the first and last of the response received.
+            handled -- the handler (or XMLStream) had returned the result.
+            completed -- the manager had the outcome.
+
+            status and size are the response's HTTP status and body length, error what the attempt
+            failed with (None if it succeeded). retry counts the failed attempts before this one,
+            follow the responses followed (e.g. NextToken pages) before it.
+            """
+    __slots__ = ('queued', 'started', 'resolved', 'connected', 'sent', 'firstByte', 'lastByte', 'handled',
+                    'completed', 'reused', 'status', 'size', 'error', 'retry', 'follow')
+
+    def __init__(self, queued, previous=None):
+        self.queued = queued
+        self.started = None
+        self.resolved = None
+        self.connected = None
+        self.sent = None
+        self.firstByte = None
+        self.lastByte = None
+        self.handled = None
+        self.completed = None
+        self.reused = False
+        self.status = None
+        self.size = None
+        self.error = None
+        if previous is None or previous.completed is None:
+            self.retry = self.follow = 0
+        elif previous.error is None:
+            self.retry = 0
+            self.follow = previous.follow + 1
+        else:
+            self.retry = previous.retry + 1
+            self.follow = previous.follow
+
+    def phases(self):
+        """Seconds spent in each phase the attempt went through: queue, resolve, connect, send,
+                wait (for AWS to answer), receive, handle, and total"""
+        phases = {}
+        self._phase(phases, 'queue', self.queued, self.started)
+        self._phase(phases, 'resolve', self.started, self.resolved)
+        self._phase(phases, 'connect', self.resolved, self.connected)
+        self._phase(phases, 'send', self.connected or self.started, self.sent)
+        self._phase(phases, 'wait', self.sent, self.firstByte)
+        self._phase(phases, 'receive', self.firstByte, self.lastByte)
+        self._phase(phases, 'handle', self.lastByte, self.handled)
+        self._phase(phases, 'total', self.queued, self.completed)
+        return phases
+
+    def _phase(self, phases, name, start, end):
+        if start is not None and end is not None:
+            phases[name] = end - start
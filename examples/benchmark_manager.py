@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+#
+# Copyright 2011 Snitch Incorporated
+#
+# This file is part of AAWS.
+#
+# AAWS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# AAWS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with AAWS.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# Times AWSRequestManager.execute over batches of requests that complete without any network
+# I/O, so that only the manager's own queueing and bookkeeping is measured. The time per request
+# should stay flat as the batch grows.
+#
+
+import sys
+import optparse
+import os
+import time
+# add parent directory to path (works even when cwd is not script's directory)
+sys.path.append(os.path.normpath(os.path.join(sys.path[0], '..')))
+import aaws
+
+
+class NullRequest(aaws.AWSRequest):
+    """Sits in the map when started, and completes successfully the next time the loop polls"""
+
+    def ExecAsync(self, manager, _map):
+        self._manager = manager
+        _map[id(self)] = self
+
+
+def nullBackend(timeout, _map):
+    for key, request in _map.items():
+        del _map[key]
+        request._manager.reqComplete(request, True, None)
+
+
+def benchmark(n, hosts, maxInFlight):
+    mgr = aaws.AWSRequestManager(maxInFlight=maxInFlight, backend=nullBackend)
+    requests = [NullRequest('host%d' % (i % hosts), '/', 'key', 'secret', 'Action', {}) for i in xrange(n)]
+    start = time.time()
+    for request in requests:
+        mgr.add(request)
+    done = mgr.execute(follow=0)
+    elapsed = time.time() - start
+    assert len(done) == n
+    return elapsed
+
+
+def main():
+    parser = optparse.OptionParser(usage='usage: %prog [options] [batch sizes]')
+    parser.add_option('--hosts', type='int', default=4, help='number of endpoints the requests are spread over')
+    parser.add_option('--inflight', type='int', default=128, help='maxInFlight for the manager')
+    options, args = parser.parse_args()
+    sizes = [int(arg) for arg in args] or [100, 1000, 10000, 100000]
+    print '%10s %10s %14s' % ('requests', 'seconds', 'us/request')
+    for n in sizes:
+        elapsed = benchmark(n, options.hosts, options.inflight)
+        print '%10d %10.3f %14.1f' % (n, elapsed, elapsed * 1e6 / n)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,457 @@
+#!/usr/bin/env python
+#
+# Copyright 2011 Snitch Incorporated
+#
+# This file is part of AAWS.
+#
+# AAWS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# AAWS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with AAWS.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# Tests of AWSRequestManager's scheduling, using requests that complete without any network I/O,
+# and of the parts it is built from: the response parser (fed over a socketpair), the rate limiter,
+# the response cache and the latency histograms
+#
+
+import sys
+import os
+import random
+import socket
+import time
+import unittest
+# add parent directory to path (works even when cwd is not script's directory)
+sys.path.append(os.path.normpath(os.path.join(sys.path[0], '..')))
+import aaws
+from aaws import aws, cache, metrics, ratelimit, route53
+from aaws.request import AWSConnection, AWSResponse
+
+
+class NullRequest(aaws.AWSRequest):
+    """Sits in the map when started, and completes successfully the next time the loop polls"""
+
+    def ExecAsync(self, manager, _map):
+        self._manager = manager
+        _map[id(self)] = self
+
+
+def nullBackend(timeout, _map):
+    for key, request in _map.items():
+        del _map[key]
+        request._manager.reqComplete(request, True, None)
+
+
+def getThing(n):
+    return NullRequest('host', '/', 'key', 'secret', 'GetThing', {'Thing': str(n)})
+
+
+class ParserManager(object):
+    """Stands in for AWSRequestManager and its pool, recording what an AWSConnection reports"""
+
+    def __init__(self):
+        self._pool = self
+        self.completed = []
+        self.released = []
+
+    def reqComplete(self, request, success, result):
+        self.completed.append((success, result))
+
+    def release(self, host, sock, uses):
+        self.released.append(sock)
+        sock.close()
+
+
+def echo(status, reason, data):
+    return status, reason, data
+
+
+class ParseHeadersTest(unittest.TestCase):
+
+    def parse(self, header):
+        response = AWSResponse(aaws.AWSRequest('host', '/', 'key', 'secret', 'GetThing', {}))
+        response.parseHeaders(header)
+        return response
+
+    def testStatusAndHeaders(self):
+        response = self.parse('HTTP/1.1 404 Not Found\r\nContent-Type: text/xml\r\nX-Amz-Id:  abc ')
+        self.assertEqual((response.status, response.reason), (404, 'Not Found'))
+        self.assertEqual(response.getHeader('Content-Type'), 'text/xml')
+        self.assertEqual(response.getHeader('x-amz-id'), 'abc')
+        self.assertEqual(response.getHeader('ETag', 'none'), 'none')
+
+    def testContinuation(self):
+        response = self.parse('HTTP/1.1 200 OK\r\nX-Long: one\r\n  two\r\n\tthree\r\nX-Next: 4')
+        self.assertEqual(response.getHeader('x-long'), 'one two three')
+        self.assertEqual(response.getHeader('x-next'), '4')
+
+    def testKeepalive(self):
+        self.assertTrue(self.parse('HTTP/1.1 200 OK').keepalive)
+        self.assertFalse(self.parse('HTTP/1.1 200 OK\r\nConnection: Close').keepalive)
+        self.assertFalse(self.parse('HTTP/1.0 200 OK').keepalive)
+        self.assertTrue(self.parse('HTTP/1.0 200 OK\r\nConnection: keep-alive').keepalive)
+
+    def testNoReason(self):
+        self.assertEqual(self.parse('HTTP/1.1 204').reason, '')
+
+
+class ParseResponseTest(unittest.TestCase):
+    """Feeds raw responses to an AWSConnection through a socketpair, a piece per handle_read"""
+
+    def setUp(self):
+        self.manager = ParserManager()
+        self.ours, self.theirs = socket.socketpair()
+
+    def tearDown(self):
+        self.ours.close()
+        self.theirs.close()
+
+    def connect(self, verb='GET'):
+        request = aaws.AWSRequest('host', '/', 'key', 'secret', 'GetThing', {}, echo, verb=verb)
+        conn = AWSConnection(request, self.manager, {})
+        conn._resetResponse()
+        conn.set_socket(self.ours)
+        conn.connected = True
+        return conn
+
+    def feed(self, conn, pieces):
+        for piece in pieces:
+            self.assertEqual(self.manager.completed, [])
+            self.theirs.sendall(piece)
+            conn.handle_read()
+
+    def result(self, pooled):
+        self.assertEqual(len(self.manager.completed), 1)
+        self.assertEqual(self.manager.released, [self.ours] if pooled else [])
+        success, result = self.manager.completed[0]
+        self.assertTrue(success, result)
+        return result
+
+    def testContentLength(self):
+        conn = self.connect()
+        self.feed(conn, ['HTTP/1.1 200 OK\r\nContent-Le', 'ngth: 10\r\n\r\n01', '2345', '6789'])
+        self.assertEqual(conn._rxlen, 10)               # the rest went straight into the preallocated body
+        self.assertEqual(self.result(True), (200, 'OK', '0123456789'))
+
+    def testContentLengthAtOnce(self):
+        self.feed(self.connect(), ['HTTP/1.1 200 OK\r\nContent-Length: 3\r\n\r\nabc'])
+        self.assertEqual(self.result(True), (200, 'OK', 'abc'))
+
+    def testEmptyBody(self):
+        self.feed(self.connect(), ['HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n'])
+        self.assertEqual(self.result(True), (200, 'OK', ''))
+
+    def testChunked(self):
+        self.feed(self.connect(), ['HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n',
+                        '4\r\nabcd\r\nA;name=value\r\n01234', '56789\r', '\n0\r\n',
+                        'X-Trailer: 1\r\nX-Other: 2\r\n', '\r\n'])
+        self.assertEqual(self.result(True), (200, 'OK', 'abcd0123456789'))
+
+    def testChunkedWithoutTrailers(self):
+        self.feed(self.connect(), ['HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n3\r\nabc\r\n0\r\n\r\n'])
+        self.assertEqual(self.result(True), (200, 'OK', 'abc'))
+
+    def testBadChunkSize(self):
+        self.feed(self.connect(), ['HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\nxyz\r\n'])
+        self.assertEqual(len(self.manager.completed), 1)
+        self.assertFalse(self.manager.completed[0][0])
+        self.assertEqual(self.manager.released, [])
+
+    def testCloseDelimited(self):
+        conn = self.connect()
+        self.feed(conn, ['HTTP/1.1 200 OK\r\n\r\nsome', ' data'])
+        self.assertEqual(self.manager.completed, [])
+        self.theirs.shutdown(socket.SHUT_WR)
+        conn.handle_read()
+        self.assertEqual(self.result(False), (200, 'OK', 'some data'))
+
+    def testClosedEarly(self):
+        conn = self.connect()
+        self.feed(conn, ['HTTP/1.1 200 OK\r\nContent-Length: 10\r\n\r\nabc'])
+        self.theirs.shutdown(socket.SHUT_WR)
+        conn.handle_read()
+        self.assertEqual(self.manager.completed, [(False, 'connection closed')])
+
+    def testNoBody(self):
+        for verb, status in (('HEAD', 200), ('GET', 204), ('GET', 304)):
+            self.tearDown()
+            self.setUp()
+            # the Content-Length describes the body that isn't sent
+            self.feed(self.connect(verb), ['HTTP/1.1 %d Whatever\r\nContent-Length: 10\r\n\r\n' % status])
+            self.assertEqual(self.result(True), (status, 'Whatever', ''))
+
+    def testExtraBytes(self):
+        # anything after the body can't be the start of the next response: the socket isn't pooled
+        self.feed(self.connect(), ['HTTP/1.1 200 OK\r\nContent-Length: 3\r\n\r\nabcHTTP/1.1'])
+        self.assertEqual(self.result(False), (200, 'OK', 'abc'))
+
+    def testExtraBytesAfterChunks(self):
+        self.feed(self.connect(), ['HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n3\r\nabc\r\n0\r\n\r\nxx'])
+        self.assertEqual(self.result(False), (200, 'OK', 'abc'))
+
+    def testRequestStillSending(self):
+        # a server may answer before it has read the whole request: that socket isn't pooled either
+        conn = self.connect()
+        conn.out_buffer = 'rest of the request'
+        self.feed(conn, ['HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n'])
+        self.assertEqual(self.result(False), (400, 'Bad Request', ''))
+
+
+class PacingTest(unittest.TestCase):
+
+    def testCoalescedRequestsArePaced(self):
+        # a request the limiter holds back comes through _enqueue again, and must not find itself
+        # already leading its own identity
+        mgr = aaws.AWSRequestManager(backend=nullBackend, coalesce=True)
+        mgr.limiter.setLimit(2, burst=1)
+        for i in range(3):
+            mgr.add(getThing(i))
+        done = mgr.execute(follow=0, timeout=5)
+        self.assertEqual(len(done), 3)
+        self.assertEqual(mgr.coalesced, 0)
+
+    def testPacedRequestsMissTheCacheOnce(self):
+        cache = aaws.ResponseCache(ttls={'GetThing': 60})
+        mgr = aaws.AWSRequestManager(backend=nullBackend, cache=cache)
+        mgr.limiter.setLimit(2, burst=1)
+        for i in range(3):
+            mgr.add(getThing(i))
+        done = mgr.execute(follow=0, timeout=5)
+        self.assertEqual(len(done), 3)
+        self.assertEqual(cache.misses, 3)
+
+
+
+def badFollower(request):
+    raise ValueError('bad page')
+
+
+class SettleTest(unittest.TestCase):
+
+    def testRaisingFollowerFailsTheBatch(self):
+        mgr = aaws.AWSRequestManager(backend=nullBackend)
+        mgr.add(NullRequest('host', '/', 'key', 'secret', 'ListThings', {}, None, badFollower))
+        try:
+            mgr.execute(retries=0, timeout=5)
+        except aws.AWSCompoundError, e:
+            self.assertEqual([type(error) for error in e.errors], [ValueError])
+        else:
+            self.fail('execute() did not raise')
+
+    def testRaisingFollowerFailsTheFuture(self):
+        mgr = aaws.AWSRequestManager(backend=nullBackend)
+        future = mgr.submit(NullRequest('host', '/', 'key', 'secret', 'ListThings', {}, None, badFollower), retries=0)
+        mgr._takeSubmitted()
+        while mgr._map:
+            mgr._poll(None)
+        self.assertRaises(aws.AWSCompoundError, future.result, 5)
+
+
+
+class AIMDTest(unittest.TestCase):
+
+    def testJitterDoesNotCutTheLimit(self):
+        rand = random.Random(1)
+        aimd = aaws.AIMD(initial=16)
+        for i in xrange(5000):
+            aimd.success('host', rand.uniform(0.02, 0.1), aimd.limit('host'))
+            self.assertTrue(aimd.limit('host') >= 16)
+
+    def testRisingLatencyCutsTheLimit(self):
+        aimd = aaws.AIMD(initial=16)
+        for i in xrange(500):
+            aimd.success('host', 0.05, aimd.limit('host'))
+        limit = aimd.limit('host')
+        for i in xrange(20):
+            aimd.success('host', 0.3, aimd.limit('host'))
+        self.assertTrue(aimd.limit('host') < limit)
+
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def request(self, host='host', action='GetThing', key='key'):
+        return aaws.AWSRequest(host, '/', key, 'secret', action, {})
+
+    def testBucketRefills(self):
+        bucket = ratelimit.TokenBucket(10, 2)
+        now = bucket.stamp
+        self.assertEqual(bucket.reserve(now), 0)
+        self.assertEqual(bucket.reserve(now), 0)
+        self.assertAlmostEqual(bucket.reserve(now), 0.1)
+        self.assertAlmostEqual(bucket.reserve(now), 0.2)
+        self.assertAlmostEqual(bucket.reserve(now + 1.0), 0)    # back to its burst, less the one taken
+
+    def testTakeOnlyWhatIsFree(self):
+        limiter = ratelimit.RateLimiter()
+        limiter.setLimit(10, burst=1, host='host')
+        now = time.time() + 1       # after the buckets are made, or they would see time run backwards
+        self.assertTrue(limiter.take(self.request(), now))
+        self.assertFalse(limiter.take(self.request(), now))
+        self.assertAlmostEqual(limiter.reserve(self.request(), now + 0.1), 0, 5)
+        self.assertTrue(limiter.take(self.request(action='GetOther', host='other'), now))
+
+    def testUnlimited(self):
+        limiter = ratelimit.RateLimiter()
+        self.assertEqual(limiter.reserve(self.request()), 0)
+        limiter.setLimit(1, burst=1, host='other')
+        for i in range(5):
+            self.assertEqual(limiter.reserve(self.request()), 0)
+
+    def testHostLimitIsShared(self):
+        limiter = ratelimit.RateLimiter()
+        limiter.setLimit(10, burst=1, host='host')
+        now = time.time() + 1       # after the buckets are made, or they would see time run backwards
+        delays = [limiter.reserve(self.request(action=action), now) for action in ('GetA', 'GetB', 'GetC', 'GetD')]
+        for delay, expected in zip(delays, (0, 0.1, 0.2, 0.3)):
+            self.assertAlmostEqual(delay, expected, 2)
+
+    def testMostSpecificLimitWins(self):
+        limiter = ratelimit.RateLimiter()
+        limiter.setLimit(1, burst=1, host='host')
+        limiter.setLimit(100, burst=5, host='host', action='GetFast')
+        now = time.time() + 1       # after the buckets are made, or they would see time run backwards
+        for i in range(5):
+            self.assertEqual(limiter.reserve(self.request(action='GetFast'), now), 0)
+        self.assertEqual(limiter.reserve(self.request(action='GetSlow'), now), 0)
+        self.assertTrue(limiter.reserve(self.request(action='GetSlow'), now) > 0.9)
+        limiter.setLimit(None, host='host')
+        self.assertEqual(limiter.reserve(self.request(action='GetSlow'), now), 0)
+
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = cache.ResponseCache(ttls={'GetThing': 60, 'ListThings': 60},
+                        invalidations={'PutThing': ['GetThing', 'ListThings']})
+
+    def request(self, action='GetThing', host='host', uri='/', **parameters):
+        return aaws.AWSRequest(host, uri, 'key', 'secret', action, parameters, echo)
+
+    def testLookup(self):
+        self.assertEqual(self.cache.lookup(self.request(Thing=1)), None)
+        self.cache.store(self.request(Thing=1), 'one', 3)
+        self.assertEqual(self.cache.lookup(self.request(Thing=1)), 'one')
+        self.assertEqual(self.cache.lookup(self.request(Thing=2)), None)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+
+    def testUncachedAction(self):
+        self.cache.store(self.request('DescribeThing'), 'one', 3)
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.cache.lookup(self.request('DescribeThing')), None)
+        self.assertEqual(self.cache.misses, 0)
+
+    def testExpiry(self):
+        self.cache.ttls['GetThing'] = -1
+        self.cache.store(self.request(), 'one', 3)
+        self.assertEqual(self.cache.lookup(self.request()), None)
+        self.assertEqual((len(self.cache), self.cache.bytes), (0, 0))
+
+    def testLeastRecentlyUsedGoesFirst(self):
+        self.cache.maxEntries = 2
+        for n in (1, 2):
+            self.cache.store(self.request(Thing=n), n, 1)
+        self.cache.lookup(self.request(Thing=1))
+        self.cache.store(self.request(Thing=3), 3, 1)
+        self.assertEqual([self.cache.lookup(self.request(Thing=n)) for n in (1, 2, 3)], [1, None, 3])
+
+    def testMaxBytes(self):
+        self.cache.maxBytes = 10
+        self.cache.store(self.request(Thing=1), 1, 6)
+        self.cache.store(self.request(Thing=2), 2, 6)
+        self.cache.store(self.request(Thing=3), 3, 11)  # never kept
+        self.assertEqual([self.cache.lookup(self.request(Thing=n)) for n in (1, 2, 3)], [None, 2, None])
+        self.assertEqual(self.cache.bytes, 6)
+
+    def testInvalidate(self):
+        for n in (1, 2):
+            self.cache.store(self.request(Thing=n), n, 1)
+        self.cache.store(self.request('ListThings'), 'all', 1)
+        self.cache.invalidate(self.request('PutThing', Thing=1, Value='x'))
+        self.assertEqual(self.cache.lookup(self.request(Thing=1)), None)
+        self.assertEqual(self.cache.lookup(self.request(Thing=2)), 2)   # disagrees on Thing
+        self.assertEqual(self.cache.lookup(self.request('ListThings')), None)   # has no Thing to disagree on
+
+    def testInvalidateScope(self):
+        self.cache.store(self.request(Thing=1), 'host', 1)
+        self.cache.store(self.request(host='other', Thing=1), 'other', 1)
+        self.cache.store(self.request(uri='/a', Thing=1), 'a', 1)
+        self.cache.store(self.request(uri='/b', Thing=1), 'b', 1)
+        self.cache.invalidate(self.request('PutThing', uri='/a', Thing=1))
+        self.assertEqual([self.cache.lookup(self.request(uri=uri, Thing=1)) for uri in ('/', '/a', '/b')], [None, None, 'b'])
+        self.assertEqual(self.cache.lookup(self.request(host='other', Thing=1)), 'other')
+        self.assertEqual((len(self.cache), self.cache.bytes), (2, 2))
+
+    def testListParametersNotCompared(self):
+        self.cache.store(self.request(**{'Thing.1': 'a'}), 'a', 1)
+        self.cache.invalidate(self.request('PutThing', **{'Thing.1': 'b'}))
+        self.assertEqual(self.cache.lookup(self.request(**{'Thing.1': 'a'})), None)
+
+    def testInvalidatingActionNotCached(self):
+        self.cache.invalidate(self.request('GetThing'))         # invalidates nothing
+        self.cache.store(self.request(), 'one', 1)
+        self.cache.invalidate(self.request('GetThing'))
+        self.assertEqual(self.cache.lookup(self.request()), 'one')
+
+
+class HistogramTest(unittest.TestCase):
+
+    def testBoundsCoverEveryValue(self):
+        histogram = metrics.Histogram(subBits=4)
+        last = 0.0
+        for index in range(200):
+            lower, upper = histogram.bounds(index)
+            if index < 8:
+                self.assertEqual((lower, upper), (index / 1e6, (index + 1) / 1e6))
+            if index >= 8:
+                self.assertAlmostEqual(lower, last, 12)         # no gaps or overlaps between buckets
+                self.assertTrue(upper - lower <= lower / 8 + 1e-12)
+            last = upper
+
+    def testRecordLandsInBounds(self):
+        histogram = metrics.Histogram()
+        for value in (0, 0.000001, 0.000063, 0.000064, 0.000127, 0.0001, 0.0123, 1.5, 3600):
+            histogram.counts = {}
+            histogram.record(value)
+            lower, upper = histogram.bounds(histogram.counts.keys()[0])
+            self.assertTrue(lower <= value < upper or abs(value - lower) < 1e-9, (value, lower, upper))
+
+    def testPercentile(self):
+        histogram = metrics.Histogram()
+        self.assertEqual(histogram.percentile(50), None)
+        for n in range(1, 1001):
+            histogram.record(n / 1000.0)
+        self.assertEqual((histogram.count, histogram.min, histogram.max), (1000, 0.001, 1.0))
+        for percent in (1, 50, 90, 99):
+            self.assertTrue(abs(histogram.percentile(percent) - percent / 100.0) <= percent / 100.0 * 0.02)
+        self.assertEqual(histogram.percentile(100), 1.0)
+        self.assertEqual(histogram.percentile(0), histogram.percentile(0.1))
+
+    def testPercentileWithinObservedRange(self):
+        histogram = metrics.Histogram()
+        histogram.record(0.0105)
+        self.assertEqual(histogram.percentile(50), 0.0105)
+        self.assertEqual(histogram.percentile(99.9), 0.0105)
+
+
+class SecureTest(unittest.TestCase):
+
+    def testManagerRefusesHTTPS(self):
+        request = route53.Route53('us-east-1', 'key', 'secret').ListHostedZones()
+        mgr = aaws.AWSRequestManager(backend=nullBackend)
+        self.assertRaises(ValueError, mgr.add, request)
+        self.assertRaises(ValueError, mgr.submit, request)
+        self.assertEqual(mgr.execute(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()